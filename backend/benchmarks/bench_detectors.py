@@ -0,0 +1,173 @@
+import argparse
+import time
+import cv2
+import numpy as np
+from common import latency_summary, load_images, print_table, write_results
+from face_service.detectors import DETECTORS, create_detector
+
+# Compares the face detection backends on CPU.
+# By default the dataset is generated: seeded classroom-like frames with
+# shaded synthetic faces at known positions, so recall is reported without any
+# local data. Those faces are crude, so recall on them ranks the backends
+# rather than predicting real-world numbers. With --images, a folder of sample
+# portraits is used instead (the enrollment photos in students/ work well):
+# each photo on its own, and tiled into collages whose tiles are the ground
+# truth face regions.
+#
+#   python benchmarks/bench_detectors.py --backends hog,haar
+#   python benchmarks/bench_detectors.py --images students
+
+
+# Each sample is (name, rgb frame, list of (x1, y1, x2, y2) regions holding one face)
+def build_dataset(images, grid_sizes, tile: int, max_side: int):
+    samples = []
+    for name, image in images:
+        scale = min(1.0, max_side / max(image.shape[:2]))
+        if scale < 1.0:
+            image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        height, width = image.shape[:2]
+        samples.append((name, cv2.cvtColor(image, cv2.COLOR_BGR2RGB), [(0, 0, width, height)]))
+    for grid in grid_sizes:
+        if grid < 2 or not images:
+            continue
+        collage = np.zeros((grid * tile, grid * tile, 3), dtype=np.uint8)
+        regions = []
+        for index in range(grid * grid):
+            _, image = images[index % len(images)]
+            row, column = divmod(index, grid)
+            x, y = column * tile, row * tile
+            collage[y:y + tile, x:x + tile] = cv2.resize(image, (tile, tile), interpolation=cv2.INTER_AREA)
+            regions.append((x, y, x + tile, y + tile))
+        samples.append((f"collage_{grid}x{grid}", cv2.cvtColor(collage, cv2.COLOR_BGR2RGB), regions))
+    return samples
+
+
+def _blob(height: int, width: int, cx: float, cy: float, sx: float, sy: float):
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    return np.exp(-(((x - cx) / sx) ** 2 + ((y - cy) / sy) ** 2) / 2)
+
+
+# Paints a frontal face of size s centred on (cx, cy) as light and shadow:
+# a bright head with dark eye sockets, brows, nostrils and mouth
+def draw_face(image, cx: int, cy: int, s: int, rng):
+    # Only the window around the face is touched, the blobs fade out well inside it
+    x0, y0 = max(0, cx - s), max(0, cy - s)
+    window = image[y0:cy + s, x0:cx + s]
+    height, width = window.shape[:2]
+    cx, cy = cx - x0, cy - y0
+    shade = 0.9 * _blob(height, width, cx, cy, s * 0.30, s * 0.42)
+    eye_y, eye_dx = cy - s * 0.10, s * 0.19 * rng.uniform(0.9, 1.1)
+    for dx in (-eye_dx, eye_dx):
+        shade -= 0.75 * _blob(height, width, cx + dx, eye_y, s * 0.075, s * 0.045)
+        shade -= 0.5 * _blob(height, width, cx + dx, eye_y - s * 0.11, s * 0.09, s * 0.02)
+    shade += 0.25 * _blob(height, width, cx, eye_y + s * 0.05, s * 0.04, s * 0.12)
+    shade -= 0.35 * _blob(height, width, cx, cy + s * 0.12, s * 0.07, s * 0.025)
+    shade -= 0.55 * _blob(height, width, cx, cy + s * 0.27, s * 0.13, s * 0.03)
+    skin = rng.integers(150, 230, 3).astype(np.float32)
+    alpha = np.clip(shade, 0, 1)[..., None]
+    blended = window.astype(np.float32) * (1 - alpha) + skin * shade[..., None]
+    window[:] = np.clip(blended, 0, 255).astype(np.uint8)
+    return image
+
+
+# Seeded frames holding 1-4 synthetic faces each, regions are the known face boxes
+def synthetic_dataset(count: int, width: int = 640, height: int = 480, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    samples = []
+    for index in range(count):
+        background = rng.integers(30, 130, (height // 8, width // 8, 3)).astype(np.uint8)
+        frame = cv2.resize(background, (width, height), interpolation=cv2.INTER_CUBIC)
+        regions = []
+        for _ in range(int(rng.integers(1, 5))):
+            size = int(rng.integers(70, 200))
+            for _ in range(20):
+                cx = int(rng.integers(size // 2, width - size // 2))
+                cy = int(rng.integers(size // 2, height - size // 2))
+                box = (cx - size * 7 // 20, cy - size // 2, cx + size * 7 // 20, cy + size * 9 // 20)
+                # Keep faces apart so every region holds exactly one of them
+                if all(box[2] < x1 or box[0] > x2 or box[3] < y1 or box[1] > y2 for x1, y1, x2, y2 in regions):
+                    frame = draw_face(frame, cx, cy, size, rng)
+                    regions.append(box)
+                    break
+        samples.append((f"synthetic_{index}", cv2.cvtColor(frame, cv2.COLOR_BGR2RGB), regions))
+    return samples
+
+
+# A region counts as found when a detection is centred inside it
+def score(boxes, regions):
+    found, extra = set(), 0
+    for top, right, bottom, left in boxes:
+        cx, cy = (left + right) / 2, (top + bottom) / 2
+        hit = next(
+            (i for i, (x1, y1, x2, y2) in enumerate(regions) if x1 <= cx < x2 and y1 <= cy < y2 and i not in found),
+            None,
+        )
+        if hit is None:
+            extra += 1
+        else:
+            found.add(hit)
+    return len(found), extra
+
+
+def run_backend(name: str, samples, repeat: int) -> dict:
+    try:
+        detector = create_detector(name)
+    except Exception as e:
+        return {"backend": name, "status": f"unavailable: {e}"}
+    # One untimed pass so model loading and lazy allocations don't skew the numbers
+    detector.detect(samples[0][1])
+    latencies = []
+    expected = found = extra = 0
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for _, frame, regions in samples:
+            frame_started = time.perf_counter()
+            boxes = detector.detect(frame)
+            latencies.append(time.perf_counter() - frame_started)
+            hits, misses = score(boxes, regions)
+            expected += len(regions)
+            found += hits
+            extra += misses
+    elapsed = time.perf_counter() - started
+    result = {
+        "backend": name,
+        "status": "ok",
+        "frames_per_sec": round(len(latencies) / elapsed, 2),
+        "faces_per_sec": round(expected / elapsed, 2) if expected else None,
+        "recall": round(found / expected, 4) if expected else None,
+        "extra_detections": extra,
+    }
+    result.update(latency_summary(latencies))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark face detection backends on CPU")
+    parser.add_argument("--images", help="folder of sample portraits, one face per image (default: synthetic faces)")
+    parser.add_argument("--synthetic", type=int, default=30, help="generated frames when --images is not given")
+    parser.add_argument("--backends", default=",".join(DETECTORS), help="comma separated backend names")
+    parser.add_argument("--grids", default="2,3", help="collage grid sizes built from the sample images")
+    parser.add_argument("--tile", type=int, default=200, help="collage tile size in pixels")
+    parser.add_argument("--max-side", type=int, default=640, help="single images are shrunk to this size")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    images = load_images(args.images) if args.images else []
+    grids = [int(grid) for grid in args.grids.split(",") if grid]
+    if args.images and not images:
+        parser.error(f"No sample images in '{args.images}'")
+    samples = build_dataset(images, grids, args.tile, args.max_side) if images else synthetic_dataset(args.synthetic)
+    if not images:
+        print("Using generated frames with synthetic faces")
+    print(f"{len(samples)} frames, {sum(len(s[2]) for s in samples)} expected faces, repeat={args.repeat}")
+
+    rows = [run_backend(name.strip(), samples, args.repeat) for name in args.backends.split(",") if name.strip()]
+    print_table(rows, ["backend", "status", "frames_per_sec", "faces_per_sec", "recall",
+                       "extra_detections", "p50_ms", "p90_ms", "p99_ms"])
+    if args.json:
+        write_results(args.json, "detectors", {"frames": len(samples), "backends": rows})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+import argparse
+import os
+import sys
+import cv2
+import numpy as np
+from common import load_images, print_table, write_results
+from face_service.encoding_cache import HASH_TOLERANCE, face_hash
+
+# How far apart the encoding cache's perceptual hashes are for the same face
+# and for different faces, which is what ENCODING_CACHE_TOLERANCE trades off.
+# Each face is hashed again under the changes it goes through between frames of
+# one camera (sensor noise, JPEG, a detector box a few pixels off, exposure),
+# and those distances are compared with the distances between different
+# people in the same size class. For every tolerance the script reports the
+# share of same-face variants that hit and the share of other people that would
+# hit by mistake; a false hit hands a face someone else's encoding.
+#
+# By default the faces are generated, each identity with its own proportions.
+# They are far more alike than real people, so their false hits are a
+# pessimistic bound. With --images, a folder of portraits is used instead:
+# one sub-folder per person, or a flat folder with one person per image.
+# Exits with an error when the configured tolerance gives false hits.
+#
+#   python benchmarks/bench_encoding_cache.py
+#   python benchmarks/bench_encoding_cache.py --images students --tolerances 0,4,8,12,16
+
+
+def _blob(height: int, width: int, cx: float, cy: float, sx: float, sy: float):
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    return np.exp(-(((x - cx) / sx) ** 2 + ((y - cy) / sy) ** 2) / 2)
+
+
+# A seeded frontal face on a seeded background, the same seed draws the same person
+def synthetic_portrait(identity: int, size: int = 160):
+    rng = np.random.default_rng(identity)
+    side = size * 2
+    background = rng.integers(30, 130, (8, 8, 3)).astype(np.uint8)
+    image = cv2.resize(background, (side, side), interpolation=cv2.INTER_CUBIC).astype(np.float32)
+    c, s = side / 2, size
+    width, height = s * rng.uniform(0.25, 0.34), s * rng.uniform(0.38, 0.46)
+    shade = 0.9 * _blob(side, side, c, c, width, height)
+    # Hair line and fringe
+    shade -= rng.uniform(0.2, 0.7) * _blob(side, side, c, c - height * rng.uniform(0.8, 1.0), width, s * 0.08)
+    eye_y = c - s * rng.uniform(0.05, 0.15)
+    eye_dx = s * rng.uniform(0.15, 0.23)
+    eye_w, eye_h = s * rng.uniform(0.05, 0.09), s * rng.uniform(0.03, 0.055)
+    brow_gap, brow = s * rng.uniform(0.08, 0.14), rng.uniform(0.2, 0.7)
+    for dx in (-eye_dx, eye_dx):
+        shade -= 0.75 * _blob(side, side, c + dx, eye_y, eye_w, eye_h)
+        shade -= brow * _blob(side, side, c + dx, eye_y - brow_gap, eye_w * 1.2, s * 0.02)
+    nose = s * rng.uniform(0.10, 0.18)
+    shade += 0.25 * _blob(side, side, c, eye_y + nose / 2, s * 0.04, nose * 0.6)
+    shade -= 0.35 * _blob(side, side, c, eye_y + nose + s * 0.05, s * 0.07, s * 0.025)
+    mouth_y = c + s * rng.uniform(0.2, 0.32)
+    shade -= rng.uniform(0.4, 0.7) * _blob(side, side, c, mouth_y, s * rng.uniform(0.09, 0.16), s * rng.uniform(0.02, 0.04))
+    skin = rng.integers(120, 230, 3).astype(np.float32)
+    alpha = np.clip(shade, 0, 1)[..., None]
+    image = image * (1 - alpha) + skin * shade[..., None]
+    image = np.clip(image, 0, 255).astype(np.uint8)
+    box = (int(c - s / 2), int(c + s * 7 / 20), int(c + s / 2), int(c - s * 7 / 20))
+    return cv2.cvtColor(image, cv2.COLOR_BGR2RGB), box
+
+
+# Each person is (name, [(rgb image, face box as (top, right, bottom, left))])
+def synthetic_people(count: int):
+    return [(f"synthetic_{identity}", [synthetic_portrait(identity)]) for identity in range(count)]
+
+
+# Portraits are cropped tightly enough that the whole image is the face box; a margin
+# is added around it so shifted boxes stay on the picture
+def _portrait(image, max_side: int):
+    scale = min(1.0, max_side / max(image.shape[:2]))
+    if scale < 1.0:
+        image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    height, width = image.shape[:2]
+    margin = max(8, max(height, width) // 10)
+    padded = cv2.copyMakeBorder(image, margin, margin, margin, margin, cv2.BORDER_REPLICATE)
+    return cv2.cvtColor(padded, cv2.COLOR_BGR2RGB), (margin, margin + width, margin + height, margin)
+
+
+def folder_people(directory: str, max_side: int):
+    people = []
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if os.path.isdir(path):
+            portraits = [_portrait(image, max_side) for _, image in load_images(path)]
+            if portraits:
+                people.append((name, portraits))
+    # Images directly in the folder are one person each
+    people.extend((name, [_portrait(image, max_side)]) for name, image in load_images(directory))
+    return people
+
+
+def _jpeg(image, quality: int):
+    encoded = cv2.imencode(".jpg", cv2.cvtColor(image, cv2.COLOR_RGB2BGR), [cv2.IMWRITE_JPEG_QUALITY, quality])[1]
+    return cv2.cvtColor(cv2.imdecode(encoded, cv2.IMREAD_COLOR), cv2.COLOR_BGR2RGB)
+
+
+def _noise(image, sigma: float, rng):
+    return np.clip(image + rng.normal(0, sigma, image.shape), 0, 255).astype(np.uint8)
+
+
+def _shift(box, dx: int, dy: int):
+    top, right, bottom, left = box
+    return top + dy, right + dx, bottom + dy, left + dx
+
+
+def _grow(box, pixels: int):
+    top, right, bottom, left = box
+    return top - pixels, right + pixels, bottom + pixels, left - pixels
+
+
+# What the same face looks like a few frames later, as (change, image, box)
+def variants(image, box, rng):
+    return [
+        ("noise_2", _noise(image, 2, rng), box),
+        ("noise_5", _noise(image, 5, rng), box),
+        ("jpeg_90", _jpeg(image, 90), box),
+        ("jpeg_70", _jpeg(image, 70), box),
+        ("jpeg_50", _jpeg(image, 50), box),
+        ("shift_1px", image, _shift(box, 1, 1)),
+        ("shift_2px", image, _shift(box, 2, -2)),
+        ("shift_4px", image, _shift(box, 4, 3)),
+        ("box_grow_2px", image, _grow(box, 2)),
+        ("brighter_5pct", np.clip(image * 1.05, 0, 255).astype(np.uint8), box),
+        ("darker_10pct", (image * 0.9).astype(np.uint8), box),
+        ("jpeg_70_shift_2px", _jpeg(_noise(image, 2, rng), 70), _shift(box, -2, 1)),
+    ]
+
+
+def _distance(a, b):
+    return (a[1] ^ b[1]).bit_count()
+
+
+def measure(people, seed: int):
+    rng = np.random.default_rng(seed)
+    same = {}
+    references = []
+    for person, portraits in people:
+        for image, box in portraits:
+            reference = face_hash(image, box)
+            references.append((person, reference))
+            for change, variant, variant_box in variants(image, box, rng):
+                key = face_hash(variant, variant_box)
+                # A box that changes size class can never hit, count it as the worst distance
+                distance = _distance(reference, key) if key[0] == reference[0] else 255
+                same.setdefault(change, []).append(distance)
+    other, same_person = [], []
+    for index, (person, key) in enumerate(references):
+        for other_person, other_key in references[index + 1:]:
+            # Only entries of the same size class are compared by the cache
+            if key[0] != other_key[0]:
+                continue
+            (same_person if person == other_person else other).append(_distance(key, other_key))
+    return same, other, same_person
+
+
+def _percentiles(distances) -> dict:
+    values = np.asarray(distances)
+    return {
+        "pairs": int(values.size),
+        "min": int(values.min()) if values.size else None,
+        "p50": round(float(np.percentile(values, 50)), 1) if values.size else None,
+        "p95": round(float(np.percentile(values, 95)), 1) if values.size else None,
+        "max": int(values.max()) if values.size else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure perceptual hash distances behind the encoding cache tolerance")
+    parser.add_argument("--images", help="folder of portraits, one sub-folder per person (default: synthetic faces)")
+    parser.add_argument("--synthetic", type=int, default=300, help="generated people when --images is not given")
+    parser.add_argument("--tolerances", default="0,2,4,6,8,10,12,16,20,24,32")
+    parser.add_argument("--max-side", type=int, default=320, help="portraits are shrunk to this size")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    if args.images:
+        people = folder_people(args.images, args.max_side)
+        if len(people) < 2:
+            parser.error(f"Need portraits of at least two people in '{args.images}'")
+    else:
+        print("Using generated faces, which are far more alike than real people")
+        people = synthetic_people(args.synthetic)
+    same, other, same_person = measure(people, args.seed)
+    all_same = [distance for distances in same.values() for distance in distances]
+    print(f"{len(people)} people, {len(all_same)} same-face variants, {len(other)} different-person pairs")
+
+    rows = [{"change": change, **_percentiles(distances)} for change, distances in same.items()]
+    rows.append({"change": "different people", **_percentiles(other)})
+    if same_person:
+        rows.append({"change": "same person, other photo", **_percentiles(same_person)})
+    print_table(rows, ["change", "pairs", "min", "p50", "p95", "max"])
+    print()
+
+    tolerances = sorted(int(tolerance) for tolerance in args.tolerances.split(",") if tolerance)
+    if HASH_TOLERANCE not in tolerances:
+        tolerances = sorted(tolerances + [HASH_TOLERANCE])
+    same_array, other_array = np.asarray(all_same), np.asarray(other)
+    table = []
+    for tolerance in tolerances:
+        false_hits = int((other_array <= tolerance).sum())
+        table.append({
+            "tolerance": tolerance,
+            "variant_hit_rate": round(float((same_array <= tolerance).mean()), 4),
+            "false_hits": false_hits,
+            "false_hit_rate": round(false_hits / len(other_array), 6) if len(other_array) else None,
+            "current": "*" if tolerance == HASH_TOLERANCE else "",
+        })
+    print_table(table, ["tolerance", "variant_hit_rate", "false_hits", "false_hit_rate", "current"])
+
+    if args.json:
+        write_results(args.json, "encoding_cache", {
+            "source": args.images or "synthetic",
+            "people": len(people),
+            "distances": rows,
+            "tolerances": table,
+        })
+    current = next(row for row in table if row["tolerance"] == HASH_TOLERANCE)
+    if current["false_hits"]:
+        print(f"ENCODING_CACHE_TOLERANCE={HASH_TOLERANCE} gives {current['false_hits']} false hits")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
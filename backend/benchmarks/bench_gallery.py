@@ -0,0 +1,116 @@
+import argparse
+import sys
+import time
+import numpy as np
+from common import print_table, write_results
+from face_service.gallery import ENCODING_SIZE, SUPPORTED_DTYPES, TOLERANCE, Gallery
+
+# Memory, matching throughput and decision agreement of the compact gallery
+# storage against the float64 encodings face_recognition produces.
+# Encodings are synthetic: random identities with probes drawn at distances
+# spread around the match tolerance, which is where quantisation could flip a
+# decision. Decisions that differ from float64 by more than --margin from the
+# tolerance make the script exit with an error.
+#
+#   python benchmarks/bench_gallery.py --sizes 50,1000,20000
+
+
+def synthetic_encodings(rng, count: int):
+    # Roughly the spread of dlib encodings: components around +-0.1, norm close to 1
+    return rng.normal(0.0, 0.09, (count, ENCODING_SIZE))
+
+
+def synthetic_probes(rng, gallery, count: int):
+    identities = rng.integers(0, len(gallery), count)
+    noise = rng.normal(0.0, 1.0, (count, ENCODING_SIZE))
+    noise *= (rng.uniform(0.2, 1.0, count) / np.linalg.norm(noise, axis=1))[:, None]
+    return gallery[identities] + noise
+
+
+# The previous matching code: float64 tuples and one face_distance call per probe
+def reference_match(known_faces, probes, tolerance: float):
+    encodings = np.array([encoding for _, encoding in known_faces])
+    results = []
+    for probe in probes:
+        distances = np.linalg.norm(encodings - probe, axis=1)
+        best = int(np.argmin(distances))
+        student_id = known_faces[best][0] if distances[best] <= tolerance else None
+        results.append((student_id, float(distances[best])))
+    return results
+
+
+def tuple_list_bytes(known_faces) -> int:
+    return sys.getsizeof(known_faces) + sum(
+        sys.getsizeof(entry) + sys.getsizeof(entry[0]) + entry[1].nbytes + 112 for entry in known_faces
+    )
+
+
+def run_size(rng, size: int, probe_count: int, dtypes, tolerance: float, margin: float):
+    encodings = synthetic_encodings(rng, size)
+    student_ids = list(range(1, size + 1))
+    probes = synthetic_probes(rng, encodings, probe_count)
+    known_faces = list(zip(student_ids, encodings))
+
+    started = time.perf_counter()
+    reference = reference_match(known_faces, probes, tolerance)
+    reference_rate = probe_count / (time.perf_counter() - started)
+    rows = [{
+        "size": size,
+        "storage": "tuples/float64",
+        "bytes": tuple_list_bytes(known_faces),
+        "queries_per_sec": round(reference_rate, 1),
+    }]
+    failed = False
+    for dtype in dtypes:
+        gallery = Gallery.from_encodings(student_ids, encodings, dtype)
+        started = time.perf_counter()
+        results = gallery.match(probes, tolerance)
+        rate = probe_count / (time.perf_counter() - started)
+        errors = np.array([abs(ours[1] - theirs[1]) for ours, theirs in zip(results, reference)])
+        mismatches = [
+            theirs[1] for ours, theirs in zip(results, reference) if ours[0] != theirs[0]
+        ]
+        outside_margin = sum(1 for distance in mismatches if abs(distance - tolerance) > margin)
+        failed = failed or outside_margin > 0
+        rows.append({
+            "size": size,
+            "storage": f"gallery/{dtype}",
+            "bytes": gallery.nbytes,
+            "queries_per_sec": round(rate, 1),
+            "max_distance_error": round(float(errors.max()), 6),
+            "decision_mismatches": len(mismatches),
+            "outside_margin": outside_margin,
+        })
+    return rows, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark compact gallery storage and matching")
+    parser.add_argument("--sizes", default="50,1000,20000", help="comma separated gallery sizes")
+    parser.add_argument("--probes", type=int, default=2000)
+    parser.add_argument("--dtypes", default=",".join(SUPPORTED_DTYPES))
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    parser.add_argument("--margin", type=float, default=0.01,
+                        help="decisions may only differ from float64 this close to the tolerance")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    dtypes = [dtype for dtype in args.dtypes.split(",") if dtype]
+    rows, failed = [], False
+    for size in (int(size) for size in args.sizes.split(",") if size):
+        size_rows, size_failed = run_size(rng, size, args.probes, dtypes, args.tolerance, args.margin)
+        rows.extend(size_rows)
+        failed = failed or size_failed
+    print_table(rows, ["size", "storage", "bytes", "queries_per_sec", "max_distance_error",
+                       "decision_mismatches", "outside_margin"])
+    if args.json:
+        write_results(args.json, "gallery", {"tolerance": args.tolerance, "margin": args.margin, "rows": rows})
+    if failed:
+        print(f"Decisions differ from float64 further than {args.margin} from the tolerance")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,370 @@
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import cv2
+import httpx
+import numpy as np
+import websockets
+from common import SRC_DIR, latency_summary, print_table, write_results
+from face_service.gallery import ENCODING_SIZE
+from face_service.gallery_store import GalleryStore
+
+# End-to-end load test of the attendance backend, fully offline.
+# Starts the API with uvicorn against SQLite (or any --database-url, e.g. a
+# local Postgres), seeds a class with a synthetic gallery, then drives
+# /ws/attendance/{bout_id} with N simulated cameras while M clients upload
+# synthetic videos to /bouts/{id}/process-video. Reports throughput, latency
+# percentiles, server CPU and peak RSS, and compares against a saved run so
+# regressions on the hot paths fail the run.
+#
+#   python benchmarks/loadtest.py --cameras 4 --uploads 2 --duration 30 --json results/$(git rev-parse --short HEAD).json
+#   python benchmarks/loadtest.py --compare results/baseline.json
+#
+# Synthetic frames have no real faces, so they load decoding, motion gating
+# and detection; pass --frames-dir with real photos to load encoding and matching too.
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+# The uvicorn server under test, with CPU and memory read from /proc (Linux only)
+class ServerProcess:
+    def __init__(self, workdir: str, database_url: str, workers: int, env: dict):
+        self.port = free_port()
+        self.base_url = f"http://127.0.0.1:{self.port}"
+        self.ws_url = f"ws://127.0.0.1:{self.port}"
+        python_path = os.pathsep.join(filter(None, [SRC_DIR, os.environ.get("PYTHONPATH")]))
+        server_env = dict(os.environ, DATABASE_URL=database_url, PYTHONPATH=python_path, **env)
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", SRC_DIR,
+             "--port", str(self.port), "--workers", str(workers), "--log-level", "warning"],
+            cwd=workdir,
+            env=server_env,
+        )
+        self.started_cpu = None
+        self.started_at = None
+
+    def _tree(self):
+        pids, pending = [], [self.process.pid]
+        while pending:
+            pid = pending.pop()
+            pids.append(pid)
+            try:
+                with open(f"/proc/{pid}/task/{pid}/children") as children:
+                    pending.extend(int(child) for child in children.read().split())
+            except OSError:
+                pass
+        return pids
+
+    def cpu_seconds(self) -> float:
+        total = 0
+        for pid in self._tree():
+            try:
+                with open(f"/proc/{pid}/stat") as stat:
+                    fields = stat.read().rsplit(")", 1)[1].split()
+                total += int(fields[11]) + int(fields[12])
+            except (OSError, IndexError, ValueError):
+                pass
+        return total / CLOCK_TICKS
+
+    def peak_rss_mb(self) -> float:
+        total = 0
+        for pid in self._tree():
+            try:
+                with open(f"/proc/{pid}/status") as status:
+                    for line in status:
+                        if line.startswith("VmHWM:"):
+                            total += int(line.split()[1])
+            except OSError:
+                pass
+        return round(total / 1024, 1)
+
+    def wait_ready(self, timeout: float = 120):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError("Server exited during startup")
+            try:
+                if httpx.get(f"{self.base_url}/readyz", timeout=1).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.2)
+        raise RuntimeError("Server did not become ready in time")
+
+    def start_measuring(self):
+        self.started_cpu = self.cpu_seconds()
+        self.started_at = time.perf_counter()
+
+    def usage(self) -> dict:
+        wall = time.perf_counter() - self.started_at
+        cpu = self.cpu_seconds() - self.started_cpu
+        return {
+            "cpu_seconds": round(cpu, 2),
+            "cpu_percent": round(100 * cpu / wall, 1),
+            "peak_rss_mb": self.peak_rss_mb(),
+        }
+
+    def stop(self):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+# JPEG frames of a smooth scene with moving blobs; static_ratio of them repeat the previous frame
+def synthetic_frames(rng, count: int, width: int, height: int, static_ratio: float, photos=()):
+    background = cv2.GaussianBlur(rng.integers(0, 256, (height, width, 3), dtype=np.uint8), (0, 0), 15)
+    frames, blobs = [], rng.uniform(0, 1, (4, 2))
+    previous = None
+    for index in range(count):
+        if previous is not None and rng.uniform() < static_ratio:
+            frames.append(previous)
+            continue
+        blobs = np.clip(blobs + rng.normal(0, 0.03, blobs.shape), 0, 1)
+        image = background.copy()
+        for x, y in blobs:
+            cv2.circle(image, (int(x * width), int(y * height)), 40, (200, 180, 160), -1)
+        if photos:
+            photo = cv2.resize(photos[index % len(photos)], (width // 3, height // 2))
+            image[:photo.shape[0], :photo.shape[1]] = photo
+        previous = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 80])[1].tobytes()
+        frames.append(previous)
+    return frames
+
+
+def synthetic_video(path: str, frames, width: int, height: int, fps: int = 30):
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+    for jpeg in frames:
+        writer.write(cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR))
+    writer.release()
+    with open(path, "rb") as video:
+        return video.read()
+
+
+# Creates the class, students and bouts through the API, then publishes a
+# synthetic gallery so the server maps it instead of running dlib on the photos
+def seed(client: httpx.Client, rng, workdir: str, gallery_dir: str, students: int, bouts: int):
+    class_id = client.post("/classes/", data={"description": "Load test"}).json()["id"]
+    portrait = cv2.imencode(".jpg", rng.integers(0, 256, (120, 100, 3), dtype=np.uint8))[1].tobytes()
+    expected = []
+    for index in range(students):
+        response = client.post(
+            "/students/",
+            data={"name": f"load test {class_id} {index}"},
+            files={"image": ("portrait.jpg", portrait, "image/jpeg")},
+        )
+        student = response.json()
+        client.post("/enrollments/", json={"student_id": student["id"], "class_id": class_id})
+        expected.append({"id": student["id"], "name": student["name"], "image_path": student["image_path"]})
+
+    encodings = {student["id"]: rng.normal(0.0, 0.09, ENCODING_SIZE) for student in expected}
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        GalleryStore(gallery_dir).get(class_id, expected, encodings=encodings)
+    finally:
+        os.chdir(cwd)
+    bout_ids = [client.post(f"/classes/{class_id}/bouts").json()["id"] for _ in range(bouts)]
+    return class_id, bout_ids
+
+
+async def camera(ws_url: str, bout_id: int, frames, duration: float, fps: float, protocol: str):
+    latencies, sent, errors = [], 0, 0
+    interval = 1.0 / fps if fps > 0 else 0
+    async with websockets.connect(f"{ws_url}/ws/attendance/{bout_id}", max_size=None) as ws:
+        if protocol == "delta":
+            await ws.send(json.dumps({"protocol": "delta", "encoding": "msgpack"}))
+            await ws.recv()
+        deadline = time.perf_counter() + duration
+        previous = None
+        while time.perf_counter() < deadline:
+            jpeg = frames[sent % len(frames)]
+            if protocol == "delta":
+                # Unchanged frames are sent as a bare sequence number
+                payload = sent.to_bytes(4, "big") + (b"" if jpeg is previous else jpeg)
+            else:
+                payload = jpeg
+            previous = jpeg
+            started = time.perf_counter()
+            await ws.send(payload)
+            response = await ws.recv()
+            latencies.append(time.perf_counter() - started)
+            if isinstance(response, str) and "error" in response:
+                errors += 1
+            sent += 1
+            if interval:
+                await asyncio.sleep(max(0.0, interval - (time.perf_counter() - started)))
+    return latencies, sent, errors
+
+
+async def uploader(base_url: str, bout_id: int, video: bytes, rounds: int):
+    latencies, errors = [], 0
+    async with httpx.AsyncClient(base_url=base_url, timeout=600) as client:
+        for round_index in range(rounds):
+            # A trailing MP4 'free' box makes every upload unique, so the server's
+            # content-hash dedup does not answer repeat rounds from stored results
+            padding = (16).to_bytes(4, "big") + b"free" + round_index.to_bytes(8, "big")
+            started = time.perf_counter()
+            response = await client.post(
+                f"/bouts/{bout_id}/process-video",
+                files={"video_file": ("load.mp4", video + padding, "video/mp4")},
+            )
+            latencies.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                errors += 1
+    return latencies, errors
+
+
+async def drive(server: ServerProcess, args, camera_bouts, upload_bouts, frames, video):
+    started = time.perf_counter()
+    camera_tasks = [
+        camera(server.ws_url, bout_id, frames, args.duration, args.fps, args.protocol)
+        for bout_id in camera_bouts
+    ]
+    upload_tasks = [uploader(server.base_url, bout_id, video, args.upload_rounds) for bout_id in upload_bouts]
+    results = await asyncio.gather(*camera_tasks, *upload_tasks)
+    elapsed = time.perf_counter() - started
+
+    camera_results = results[:len(camera_tasks)]
+    upload_results = results[len(camera_tasks):]
+    frame_latencies = [latency for latencies, _, _ in camera_results for latency in latencies]
+    frames_sent = sum(sent for _, sent, _ in camera_results)
+    upload_latencies = [latency for latencies, _ in upload_results for latency in latencies]
+    live = {
+        "cameras": len(camera_tasks),
+        "frames": frames_sent,
+        "errors": sum(errors for _, _, errors in camera_results),
+        "frames_per_sec": round(frames_sent / args.duration, 2) if camera_tasks else None,
+    }
+    live.update(latency_summary(frame_latencies))
+    uploads = {
+        "clients": len(upload_tasks),
+        "videos": len(upload_latencies),
+        "errors": sum(errors for _, errors in upload_results),
+        "videos_per_min": round(60 * len(upload_latencies) / elapsed, 2) if upload_tasks else None,
+    }
+    uploads.update(latency_summary(upload_latencies))
+    return {"wall_seconds": round(elapsed, 2), "live": live, "uploads": uploads}
+
+
+# Metrics where a higher value is a regression, and the ones where a lower value is
+WORSE_WHEN_HIGHER = [("live", "p50_ms"), ("live", "p99_ms"), ("uploads", "p50_ms"), ("uploads", "p99_ms"),
+                     ("server", "cpu_percent"), ("server", "peak_rss_mb")]
+WORSE_WHEN_LOWER = [("live", "frames_per_sec"), ("uploads", "videos_per_min")]
+
+
+def compare(results: dict, baseline_path: str, threshold: float) -> bool:
+    with open(baseline_path) as baseline_file:
+        baseline = json.load(baseline_file)
+    print(f"\nCompared with {baseline_path} (commit {baseline.get('commit')}), threshold {threshold:.0%}")
+    rows, regressed = [], False
+    checks = [(keys, True) for keys in WORSE_WHEN_HIGHER] + [(keys, False) for keys in WORSE_WHEN_LOWER]
+    for (section, name), higher_is_worse in checks:
+        old = baseline["results"].get(section, {}).get(name)
+        new = results.get(section, {}).get(name)
+        if not old or new is None:
+            continue
+        change = (new - old) / old
+        worse = change > threshold if higher_is_worse else change < -threshold
+        # CPU usage and memory are reported but only latency and throughput fail the run
+        fails = worse and section != "server"
+        regressed = regressed or fails
+        rows.append({
+            "metric": f"{section}.{name}",
+            "baseline": old,
+            "current": new,
+            "change": f"{change:+.1%}",
+            "status": "REGRESSION" if fails else ("worse" if worse else "ok"),
+        })
+    print_table(rows, ["metric", "baseline", "current", "change", "status"])
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the attendance backend")
+    parser.add_argument("--cameras", type=int, default=4, help="concurrent live WebSocket feeds")
+    parser.add_argument("--uploads", type=int, default=1, help="concurrent process-video clients")
+    parser.add_argument("--upload-rounds", type=int, default=1, help="videos uploaded by each client")
+    parser.add_argument("--duration", type=float, default=20, help="seconds each camera streams")
+    parser.add_argument("--fps", type=float, default=2, help="frames per second per camera, 0 for as fast as possible")
+    parser.add_argument("--protocol", choices=["legacy", "delta"], default="legacy")
+    parser.add_argument("--students", type=int, default=40, help="students in the synthetic class gallery")
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--static-ratio", type=float, default=0.5, help="share of frames identical to the previous one")
+    parser.add_argument("--video-seconds", type=int, default=20, help="length of the synthetic upload at 30 fps")
+    parser.add_argument("--frames-dir", help="photos pasted into the frames, to exercise encoding and matching")
+    parser.add_argument("--database-url", help="defaults to a fresh SQLite file")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--compare", help="results file of a previous run to compare with")
+    parser.add_argument("--threshold", type=float, default=0.15, help="relative change that counts as a regression")
+    parser.add_argument("--keep", action="store_true", help="keep the temporary work folder")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    workdir = tempfile.mkdtemp(prefix="marrow-load-")
+    os.makedirs(os.path.join(workdir, "students"))
+    gallery_dir = os.path.join(workdir, "galleries")
+    database_url = args.database_url or f"sqlite:///{os.path.join(workdir, 'load.db')}"
+    photos = [cv2.imread(os.path.join(args.frames_dir, name)) for name in sorted(os.listdir(args.frames_dir))] \
+        if args.frames_dir else []
+    photos = [photo for photo in photos if photo is not None]
+
+    frames = synthetic_frames(rng, 120, args.width, args.height, args.static_ratio, photos)
+    video = synthetic_video(
+        os.path.join(workdir, "upload.mp4"),
+        synthetic_frames(rng, args.video_seconds * 30, args.width, args.height, args.static_ratio, photos),
+        args.width, args.height,
+    )
+
+    server = ServerProcess(workdir, database_url, args.workers, {"GALLERY_DIR": gallery_dir, "AUTO_CREATE_TABLES": "1"})
+    try:
+        server.wait_ready()
+        with httpx.Client(base_url=server.base_url, timeout=60) as client:
+            _, bout_ids = seed(client, rng, workdir, gallery_dir, args.students, args.cameras + args.uploads)
+        print(f"Seeded {args.students} students, running {args.cameras} cameras and {args.uploads} upload clients")
+        server.start_measuring()
+        results = asyncio.run(
+            drive(server, args, bout_ids[:args.cameras], bout_ids[args.cameras:], frames, video)
+        )
+        results["server"] = server.usage()
+    finally:
+        server.stop()
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    results["config"] = {
+        key: getattr(args, key)
+        for key in ("cameras", "uploads", "upload_rounds", "duration", "fps", "protocol", "students",
+                    "width", "height", "static_ratio", "video_seconds", "workers")
+    }
+    results["config"]["database"] = database_url.split(":", 1)[0]
+    print_table(
+        [dict(section=section, **results[section]) for section in ("live", "uploads", "server")],
+        ["section", "frames", "videos", "errors", "frames_per_sec", "videos_per_min",
+         "p50_ms", "p99_ms", "cpu_percent", "peak_rss_mb"],
+    )
+    if args.json:
+        write_results(args.json, "loadtest", results)
+    if args.compare and compare(results, args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
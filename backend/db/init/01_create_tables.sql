@@ -29,4 +29,16 @@ CREATE TABLE IF NOT EXISTS attendance (
     presence BOOLEAN DEFAULT FALSE,
     register_time TIMESTAMP,
     UNIQUE (student_id, bout_id)
-);
\ No newline at end of file
+);
+
+CREATE TABLE IF NOT EXISTS video_job (
+    id SERIAL PRIMARY KEY,
+    bout_id INT NOT NULL REFERENCES bout(id) ON DELETE CASCADE,
+    content_hash CHAR(64) NOT NULL,
+    file_path VARCHAR(255),
+    status VARCHAR(20) NOT NULL DEFAULT 'processing',
+    last_frame INT NOT NULL DEFAULT 0,
+    found_ids TEXT NOT NULL DEFAULT '[]',
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    UNIQUE (bout_id, content_hash)
+);
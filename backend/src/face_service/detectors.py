@@ -0,0 +1,160 @@
+import os
+import numpy as np
+from typing import List, Tuple
+
+# Face detection backends for FaceProcessor.
+# Every backend takes an RGB frame and returns face boxes in the
+# (top, right, bottom, left) order used by face_recognition, so the
+# encoding and matching steps don't care which detector found the face.
+# The backend is picked per deployment with the FACE_DETECTOR variable.
+# OpenCV and dlib are imported on first use, so importing this module stays cheap.
+
+Box = Tuple[int, int, int, int]
+
+
+class FaceDetector:
+    name = "base"
+
+    def detect(self, rgb_frame) -> List[Box]:
+        raise NotImplementedError
+
+    # Converts (x, y, w, h) rectangles to (top, right, bottom, left), clipped to the frame
+    @staticmethod
+    def _to_css(rects, shape) -> List[Box]:
+        height, width = shape[:2]
+        boxes = []
+        for x, y, w, h in rects:
+            top, left = max(0, int(y)), max(0, int(x))
+            bottom, right = min(height, int(y + h)), min(width, int(x + w))
+            if bottom > top and right > left:
+                boxes.append((top, right, bottom, left))
+        return boxes
+
+
+# dlib HOG detector, the face_recognition default
+class HogDetector(FaceDetector):
+    name = "hog"
+
+    def __init__(self, upsample: int = int(os.getenv("FACE_HOG_UPSAMPLE", "1"))):
+        self.upsample = upsample
+
+    def detect(self, rgb_frame) -> List[Box]:
+        import face_recognition
+        return face_recognition.face_locations(rgb_frame, self.upsample, model="hog")
+
+
+# OpenCV cascade classifier, works with both Haar and LBP cascade files
+class CascadeDetector(FaceDetector):
+    def __init__(self, cascade_path: str, scale_factor: float = 1.1, min_neighbors: int = 5,
+                 min_size: int = int(os.getenv("FACE_MIN_SIZE", "40"))):
+        import cv2
+        self.classifier = cv2.CascadeClassifier(cascade_path)
+        if self.classifier.empty():
+            raise ValueError(f"Could not load cascade file: {cascade_path}")
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+        self.min_size = (min_size, min_size)
+
+    def detect(self, rgb_frame) -> List[Box]:
+        import cv2
+        gray = cv2.cvtColor(rgb_frame, cv2.COLOR_RGB2GRAY)
+        gray = cv2.equalizeHist(gray)
+        rects = self.classifier.detectMultiScale(
+            gray,
+            scaleFactor=self.scale_factor,
+            minNeighbors=self.min_neighbors,
+            minSize=self.min_size,
+        )
+        return self._to_css(rects, rgb_frame.shape)
+
+
+class HaarDetector(CascadeDetector):
+    name = "haar"
+
+    def __init__(self, cascade_path: str = None, **kwargs):
+        import cv2
+        cascade_path = cascade_path or os.getenv(
+            "FACE_HAAR_CASCADE",
+            os.path.join(cv2.data.haarcascades, "haarcascade_frontalface_default.xml"),
+        )
+        super().__init__(cascade_path, **kwargs)
+
+
+# The pip OpenCV wheels don't ship LBP cascades, so the file must be provided
+class LbpDetector(CascadeDetector):
+    name = "lbp"
+
+    def __init__(self, cascade_path: str = None, **kwargs):
+        cascade_path = cascade_path or os.getenv("FACE_LBP_CASCADE", "models/lbpcascade_frontalface_improved.xml")
+        super().__init__(cascade_path, **kwargs)
+
+
+# OpenCV ResNet-10 SSD face detector (Caffe model) on the CPU DNN backend
+class SsdDetector(FaceDetector):
+    name = "ssd"
+
+    def __init__(self, prototxt: str = None, model: str = None,
+                 confidence: float = float(os.getenv("FACE_DNN_CONFIDENCE", "0.5"))):
+        prototxt = prototxt or os.getenv("FACE_SSD_PROTOTXT", "models/deploy.prototxt")
+        model = model or os.getenv("FACE_SSD_MODEL", "models/res10_300x300_ssd_iter_140000.caffemodel")
+        import cv2
+        self.net = cv2.dnn.readNetFromCaffe(prototxt, model)
+        self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        self.confidence = confidence
+
+    def detect(self, rgb_frame) -> List[Box]:
+        import cv2
+        height, width = rgb_frame.shape[:2]
+        # The model was trained on BGR with this BGR mean; swapRB turns the RGB frame into BGR
+        # before the mean is subtracted, and blobFromImage does the resize
+        blob = cv2.dnn.blobFromImage(rgb_frame, 1.0, (300, 300), (104.0, 177.0, 123.0), swapRB=True)
+        self.net.setInput(blob)
+        detections = self.net.forward()[0, 0]
+        rects = []
+        for detection in detections:
+            if detection[2] < self.confidence:
+                continue
+            x1, y1, x2, y2 = detection[3:7] * np.array([width, height, width, height])
+            rects.append((x1, y1, x2 - x1, y2 - y1))
+        return self._to_css(rects, rgb_frame.shape)
+
+
+# OpenCV YuNet detector (ONNX model) on the CPU DNN backend
+class YuNetDetector(FaceDetector):
+    name = "yunet"
+
+    def __init__(self, model: str = None,
+                 confidence: float = float(os.getenv("FACE_DNN_CONFIDENCE", "0.8"))):
+        model = model or os.getenv("FACE_YUNET_MODEL", "models/face_detection_yunet_2023mar.onnx")
+        import cv2
+        self.detector = cv2.FaceDetectorYN.create(
+            model, "", (320, 320), confidence, 0.3, 5000,
+            cv2.dnn.DNN_BACKEND_OPENCV, cv2.dnn.DNN_TARGET_CPU
+        )
+        self.input_size = None
+
+    def detect(self, rgb_frame) -> List[Box]:
+        import cv2
+        height, width = rgb_frame.shape[:2]
+        if self.input_size != (width, height):
+            self.detector.setInputSize((width, height))
+            self.input_size = (width, height)
+        _, faces = self.detector.detect(cv2.cvtColor(rgb_frame, cv2.COLOR_RGB2BGR))
+        if faces is None:
+            return []
+        return self._to_css([face[:4] for face in faces], rgb_frame.shape)
+
+
+DETECTORS = {
+    detector.name: detector
+    for detector in (HogDetector, HaarDetector, LbpDetector, SsdDetector, YuNetDetector)
+}
+
+
+# Builds the detector configured for this deployment (FACE_DETECTOR, defaults to dlib HOG)
+def create_detector(name: str = None, **kwargs) -> FaceDetector:
+    name = (name or os.getenv("FACE_DETECTOR", "hog")).lower()
+    if name not in DETECTORS:
+        raise ValueError(f"Unknown face detector '{name}', expected one of {sorted(DETECTORS)}")
+    return DETECTORS[name](**kwargs)
@@ -0,0 +1,258 @@
+import atexit
+import os
+import sqlite3
+import threading
+import time
+import numpy as np
+from collections import OrderedDict
+from monitoring.metrics import ENCODING_CACHE
+
+# Cache of face encodings keyed by a perceptual hash of the face crop.
+# Re-processed videos and live feeds keep showing the same faces, and a crop
+# that looks the same gives the same 128-d encoding, so the expensive dlib
+# encoding step can be skipped for it. The in-memory tier is an LRU with a TTL;
+# an optional SQLite file adds a larger tier shared by every worker on the host.
+#
+# The key is a 255-bit DCT hash of the crop plus its size class. JPEG noise
+# flips some bits between frames, so the in-memory tier also accepts entries
+# of the same size class within ENCODING_CACHE_TOLERANCE differing bits. Those
+# near matches are only looked for among the faces of the same scope (the bout
+# being processed), so a wrong match can only come from the few people in the
+# room and not from every face the process has seen. The disk tier only
+# matches exactly and serves every scope.
+#
+# The disk tier is best effort: writes and last-use updates are batched into
+# one transaction every ENCODING_CACHE_DISK_BATCH operations or
+# ENCODING_CACHE_DISK_FLUSH_SECONDS, and any SQLite error (a locked or broken
+# file) counts as a miss instead of failing the frame.
+
+CACHE_SIZE = int(os.getenv("ENCODING_CACHE_SIZE", "2048"))
+CACHE_TTL = float(os.getenv("ENCODING_CACHE_TTL", "3600"))
+CACHE_PATH = os.getenv("ENCODING_CACHE_PATH") or None
+DISK_CACHE_SIZE = int(os.getenv("ENCODING_CACHE_DISK_SIZE", "100000"))
+DISK_BATCH = int(os.getenv("ENCODING_CACHE_DISK_BATCH", "64"))
+DISK_FLUSH_SECONDS = float(os.getenv("ENCODING_CACHE_DISK_FLUSH_SECONDS", "5"))
+# Differing hash bits (out of 255) still treated as the same crop. Measured with
+# benchmarks/bench_encoding_cache.py on generated faces: different people were
+# never closer than 40 bits, while the same crop after noise, JPEG or exposure
+# changes was mostly 15-40 bits away. 16 stays under half of that closest
+# different-person distance; see the README before raising it.
+HASH_TOLERANCE = int(os.getenv("ENCODING_CACHE_TOLERANCE", "16"))
+HASH_SIZE = 16
+
+
+# Perceptual hash of a face crop: low frequencies of its DCT compared to their median.
+# Returns (size class, hash bits), or None for an empty crop.
+def face_hash(rgb_frame, location):
+    import cv2
+    top, right, bottom, left = location
+    crop = rgb_frame[max(0, top):bottom, max(0, left):right]
+    if crop.size == 0:
+        return None
+    gray = cv2.cvtColor(crop, cv2.COLOR_RGB2GRAY)
+    small = cv2.resize(gray, (HASH_SIZE * 4, HASH_SIZE * 4), interpolation=cv2.INTER_AREA)
+    low = cv2.dct(small.astype(np.float32))[:HASH_SIZE, :HASH_SIZE].flatten()[1:]
+    bits = np.packbits(low > np.median(low))
+    size_class = int(np.log2(max(bottom - top, 1)))
+    return size_class, int.from_bytes(bits.tobytes(), "big")
+
+
+def _disk_key(key) -> str:
+    return f"{key[0]}-{key[1]:x}"
+
+
+class EncodingCache:
+    def __init__(self, max_entries: int = CACHE_SIZE, ttl: float = CACHE_TTL,
+                 path: str = CACHE_PATH, max_disk_entries: int = DISK_CACHE_SIZE,
+                 tolerance: int = HASH_TOLERANCE, disk_batch: int = DISK_BATCH,
+                 disk_flush_seconds: float = DISK_FLUSH_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.tolerance = tolerance
+        self.max_disk_entries = max_disk_entries
+        self.disk_batch = disk_batch
+        self.disk_flush_seconds = disk_flush_seconds
+        # (scope, size class, hash) -> (encoding, stored_at), oldest use first
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk = None
+        # The SQLite connection and its pending writes have their own lock, so
+        # lookups in memory never wait on the file
+        self._disk_lock = threading.Lock()
+        # disk key -> (encoding bytes, stored_at, used_at); bytes are None for rows
+        # that were only read and just need their used_at moved
+        self._disk_pending = {}
+        self._disk_flushed_at = time.time()
+        self._disk_flushes = 0
+        self.hits = self.disk_hits = self.misses = self.evictions = self.disk_errors = 0
+        if path and self.enabled:
+            try:
+                self._disk = sqlite3.connect(path, check_same_thread=False, timeout=1)
+                # Readers in other workers keep going while one of them writes
+                self._disk.execute("PRAGMA journal_mode=WAL")
+                self._disk.execute(
+                    "CREATE TABLE IF NOT EXISTS encodings "
+                    "(key TEXT PRIMARY KEY, encoding BLOB NOT NULL, stored_at REAL NOT NULL, used_at REAL NOT NULL)"
+                )
+                self._disk.commit()
+            except sqlite3.Error as e:
+                print(f"Encoding cache file {path} unusable, keeping the cache in memory: {e}")
+                self._disk = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def _disk_error(self, e: sqlite3.Error, bout=""):
+        self.disk_errors += 1
+        ENCODING_CACHE.inc(bout=bout, result="disk_error")
+        print(f"Encoding cache file error, treated as a miss: {e}")
+        try:
+            self._disk.rollback()
+        except sqlite3.Error:
+            pass
+
+    # Called with _disk_lock held
+    def _disk_get(self, key, now: float, bout=""):
+        key = _disk_key(key)
+        pending = self._disk_pending.get(key)
+        if pending is not None and pending[0] is not None:
+            return np.frombuffer(pending[0], dtype=np.float64), pending[1]
+        try:
+            row = self._disk.execute(
+                "SELECT encoding, stored_at FROM encodings WHERE key = ?", (key,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            self._disk_error(e, bout)
+            return None
+        # Expired rows are left for the next trim
+        if row is None or now - row[1] > self.ttl:
+            return None
+        self._disk_pending[key] = (None, row[1], now)
+        self._disk_maybe_flush(now)
+        return np.frombuffer(row[0], dtype=np.float64), row[1]
+
+    # Called with _disk_lock held
+    def _disk_put(self, key, encoding, now: float):
+        self._disk_pending[_disk_key(key)] = (np.asarray(encoding, dtype=np.float64).tobytes(), now, now)
+        self._disk_maybe_flush(now)
+
+    def _disk_maybe_flush(self, now: float):
+        if len(self._disk_pending) >= self.disk_batch or now - self._disk_flushed_at >= self.disk_flush_seconds:
+            self._disk_flush(now)
+
+    # Writes the pending rows and last-use times in one transaction. A failed batch
+    # is dropped, it only costs some future misses.
+    def _disk_flush(self, now: float):
+        pending, self._disk_pending = self._disk_pending, {}
+        self._disk_flushed_at = now
+        if not pending:
+            return
+        stored = [(key, row[0], row[1], row[2]) for key, row in pending.items() if row[0] is not None]
+        touched = [(row[2], key) for key, row in pending.items() if row[0] is None]
+        try:
+            self._disk.executemany(
+                "INSERT OR REPLACE INTO encodings (key, encoding, stored_at, used_at) VALUES (?, ?, ?, ?)", stored
+            )
+            self._disk.executemany("UPDATE encodings SET used_at = ? WHERE key = ?", touched)
+            self._disk_flushes += 1
+            # Trim expired and least recently used rows now and then instead of on every flush
+            if self._disk_flushes % 16 == 0:
+                self._disk.execute("DELETE FROM encodings WHERE stored_at < ?", (now - self.ttl,))
+                self._disk.execute(
+                    "DELETE FROM encodings WHERE key IN "
+                    "(SELECT key FROM encodings ORDER BY used_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_disk_entries,),
+                )
+            self._disk.commit()
+        except sqlite3.Error as e:
+            self._disk_error(e)
+
+    # Writes whatever is pending, e.g. before the process exits
+    def flush(self):
+        if self._disk is not None:
+            with self._disk_lock:
+                self._disk_flush(time.time())
+
+    # Closest live entry of the same scope and size class within the tolerance
+    def _nearest(self, key, now: float):
+        if key in self._entries:
+            candidates = [key]
+        elif self.tolerance > 0:
+            scope, size_class, value = key
+            candidates = [
+                other for other in self._entries
+                if other[0] == scope and other[1] == size_class and (other[2] ^ value).bit_count() <= self.tolerance
+            ]
+        else:
+            candidates = []
+        for candidate in candidates:
+            if now - self._entries[candidate][1] > self.ttl:
+                del self._entries[candidate]
+        candidates = [candidate for candidate in candidates if candidate in self._entries]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda other: (other[2] ^ key[2]).bit_count())
+
+    # key is a face_hash() result, scope limits near matches to faces seen in the same bout
+    # and labels the lookup metrics
+    def get(self, key, scope=None):
+        if not self.enabled or key is None:
+            return None
+        bout = "" if scope is None else scope
+        now = time.time()
+        entry_key = (scope, *key)
+        with self._lock:
+            match = self._nearest(entry_key, now)
+            if match is not None:
+                self._entries.move_to_end(match)
+                self.hits += 1
+                ENCODING_CACHE.inc(bout=bout, result="hit")
+                return self._entries[match][0]
+        entry = None
+        if self._disk is not None:
+            with self._disk_lock:
+                entry = self._disk_get(key, now, bout)
+        with self._lock:
+            if entry is not None:
+                self._store(entry_key, *entry)
+                self.disk_hits += 1
+                ENCODING_CACHE.inc(bout=bout, result="disk_hit")
+                return entry[0]
+            self.misses += 1
+            ENCODING_CACHE.inc(bout=bout, result="miss")
+            return None
+
+    def put(self, key, encoding, scope=None):
+        if not self.enabled or key is None:
+            return
+        now = time.time()
+        with self._lock:
+            self._store((scope, *key), encoding, now)
+        if self._disk is not None:
+            with self._disk_lock:
+                self._disk_put(key, encoding, now)
+
+    def _store(self, key, encoding, stored_at: float):
+        self._entries[key] = (encoding, stored_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "disk_errors": self.disk_errors,
+            "hit_rate": round((self.hits + self.disk_hits) / lookups, 4) if lookups else None,
+        }
+
+
+# One cache per process, the optional disk tier is shared between processes
+encoding_cache = EncodingCache()
+atexit.register(encoding_cache.flush)
@@ -0,0 +1,90 @@
+import os
+import numpy as np
+
+# Compact storage for the encodings of the students expected in a class.
+# Instead of a list of (student_id, float64 encoding) tuples, the gallery keeps
+# one matrix with a row per student, stored as float16 or as int8 with a scale
+# per row. Matching computes the same Euclidean distance face_recognition uses,
+# so accept/reject decisions match float64 up to the quantisation error, which
+# benchmarks/bench_gallery.py measures.
+
+# Same default as face_recognition.compare_faces
+TOLERANCE = float(os.getenv("FACE_MATCH_TOLERANCE", "0.6"))
+GALLERY_DTYPE = os.getenv("GALLERY_DTYPE", "float16")
+SUPPORTED_DTYPES = ("float64", "float32", "float16", "int8")
+# dlib face encodings are 128-d vectors
+ENCODING_SIZE = 128
+# Rows converted to float32 at a time while matching, bounds the temporary memory
+CHUNK_ROWS = 4096
+
+
+class Gallery:
+    def __init__(self, student_ids, matrix, scales=None, norms=None):
+        self.student_ids = np.asarray(student_ids, dtype=np.int64)
+        self.matrix = matrix
+        self.scales = scales
+        # Squared norms of the stored (dequantised) rows, precomputed for matching
+        self.norms = norms if norms is not None else np.einsum(
+            "ij,ij->i", self._rows(0, len(self.student_ids)), self._rows(0, len(self.student_ids))
+        ).astype(np.float32)
+
+    @classmethod
+    def from_encodings(cls, student_ids, encodings, dtype: str = None):
+        dtype = dtype or GALLERY_DTYPE
+        if dtype not in SUPPORTED_DTYPES:
+            raise ValueError(f"Unsupported gallery dtype '{dtype}', expected one of {SUPPORTED_DTYPES}")
+        encodings = np.asarray(encodings, dtype=np.float64).reshape(len(student_ids), ENCODING_SIZE)
+        if dtype != "int8":
+            return cls(student_ids, encodings.astype(dtype))
+        # Symmetric per-row quantisation: row = int8 values * scale
+        peaks = np.abs(encodings).max(axis=1) if len(encodings) else np.zeros(0)
+        scales = np.where(peaks > 0, peaks / 127.0, 1.0).astype(np.float32)
+        matrix = np.clip(np.rint(encodings / scales[:, None]), -127, 127).astype(np.int8)
+        return cls(student_ids, matrix, scales)
+
+    @classmethod
+    def empty(cls, dtype: str = None):
+        return cls.from_encodings([], np.zeros((0, ENCODING_SIZE)), dtype)
+
+    def __len__(self):
+        return len(self.student_ids)
+
+    @property
+    def nbytes(self) -> int:
+        total = self.student_ids.nbytes + self.matrix.nbytes + self.norms.nbytes
+        if self.scales is not None:
+            total += self.scales.nbytes
+        return total
+
+    # Rows start:stop as float32, dequantised when stored as int8
+    def _rows(self, start: int, stop: int):
+        rows = self.matrix[start:stop].astype(np.float32)
+        if self.scales is not None:
+            rows *= self.scales[start:stop, None]
+        return rows
+
+    # Euclidean distance between every query encoding and every gallery row
+    def distances(self, encodings):
+        queries = np.asarray(encodings, dtype=np.float32).reshape(-1, self.matrix.shape[1])
+        dots = np.empty((len(queries), len(self)), dtype=np.float32)
+        for start in range(0, len(self), CHUNK_ROWS):
+            stop = min(start + CHUNK_ROWS, len(self))
+            dots[:, start:stop] = queries @ self._rows(start, stop).T
+        squared = self.norms[None, :] + np.einsum("ij,ij->i", queries, queries)[:, None] - 2 * dots
+        return np.sqrt(np.maximum(squared, 0))
+
+    # Best gallery match for each encoding: (student_id or None, distance)
+    def match(self, encodings, tolerance: float = TOLERANCE):
+        encodings = list(encodings)
+        if not encodings:
+            return []
+        if not len(self):
+            return [(None, float("inf")) for _ in encodings]
+        distances = self.distances(encodings)
+        best = np.argmin(distances, axis=1)
+        results = []
+        for row, index in enumerate(best):
+            distance = float(distances[row, index])
+            student_id = int(self.student_ids[index]) if distance <= tolerance else None
+            results.append((student_id, distance))
+        return results
@@ -0,0 +1,194 @@
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import numpy as np
+from typing import Dict, List
+from face_service.gallery import GALLERY_DTYPE, Gallery
+from monitoring.metrics import GALLERY_LOADS
+
+# Galleries shared by every worker process on the machine.
+# The first worker that needs a class gallery encodes it and publishes the
+# matrices as .npy files under GALLERY_DIR (tmpfs by default). Every worker then
+# memory-maps the same files, so the pages are shared and a new worker starts
+# without encoding anything.
+#
+# Layout:  GALLERY_DIR/class_<id>/<version>/{ids,matrix,scales,norms}.npy + manifest.json
+#          GALLERY_DIR/class_<id>/current   holds the version currently published
+#
+# The version is a hash of the enrolled students and their image files, so any
+# enrollment or photo change produces a new version. A new version is written to
+# a temporary folder, renamed into place and then `current` is replaced, which
+# makes the swap atomic for readers. Students whose photo did not change keep
+# their previous encoding instead of being encoded again.
+
+GALLERY_DIR = os.getenv(
+    "GALLERY_DIR",
+    os.path.join("/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(), "marrow-galleries"),
+)
+
+
+# Identifies a student's photo, changes when the photo is replaced
+def _student_key(student: Dict) -> str:
+    image_path = student.get("image_path") or ""
+    try:
+        stat = os.stat(image_path)
+        signature = f"{stat.st_mtime_ns}:{stat.st_size}"
+    except OSError:
+        signature = "missing"
+    return f"{student['id']}:{image_path}:{signature}"
+
+
+class GalleryStore:
+    def __init__(self, directory: str = GALLERY_DIR, dtype: str = None):
+        self.directory = directory
+        self.dtype = dtype or GALLERY_DTYPE
+        # class_id -> (version, mapped gallery) for this process
+        self._mapped = {}
+        # One lock per class, so building one gallery doesn't hold up the others
+        self._locks = {}
+        self._guard = threading.Lock()
+
+    def _class_dir(self, class_id: int) -> str:
+        return os.path.join(self.directory, f"class_{class_id}")
+
+    def _version(self, keys: List[str]) -> str:
+        digest = hashlib.sha1(self.dtype.encode())
+        for key in keys:
+            digest.update(key.encode())
+            digest.update(b"\0")
+        return digest.hexdigest()[:16]
+
+    def _current_version(self, class_id: int):
+        try:
+            with open(os.path.join(self._class_dir(class_id), "current")) as pointer:
+                return pointer.read().strip()
+        except OSError:
+            return None
+
+    # Maps a published version read-only, without copying it into this process
+    def _map(self, class_id: int, version: str):
+        path = os.path.join(self._class_dir(class_id), version)
+        with open(os.path.join(path, "manifest.json")) as manifest_file:
+            manifest = json.load(manifest_file)
+        scales = np.load(os.path.join(path, "scales.npy"), mmap_mode="r") if manifest["quantized"] else None
+        gallery = Gallery(
+            np.load(os.path.join(path, "ids.npy"), mmap_mode="r"),
+            np.load(os.path.join(path, "matrix.npy"), mmap_mode="r"),
+            scales,
+            np.load(os.path.join(path, "norms.npy"), mmap_mode="r"),
+        )
+        return gallery, manifest["keys"]
+
+    # Encodes the students that changed since the previous version and publishes the result
+    def _publish(self, class_id: int, version: str, students: List[Dict], keys: List[str],
+                 known: Dict = None) -> None:
+        # Imported here so processes that only map galleries never load dlib for it
+        from face_service.processor import encode_student_images
+
+        class_dir = self._class_dir(class_id)
+        previous = {}
+        current = self._current_version(class_id)
+        if current:
+            try:
+                old_gallery, old_keys = self._map(class_id, current)
+                rows = old_gallery._rows(0, len(old_gallery))
+                previous = {key: rows[index] for index, key in enumerate(old_keys)}
+            except (OSError, ValueError, KeyError):
+                previous = {}
+
+        known = known or {}
+        to_encode = [
+            student for student, key in zip(students, keys)
+            if key not in previous and student["id"] not in known
+        ]
+        encoded_ids, encoded = encode_student_images(to_encode) if to_encode else ([], [])
+        encoded_by_id = {**known, **dict(zip(encoded_ids, encoded))}
+        student_ids, encodings, row_keys = [], [], []
+        for student, key in zip(students, keys):
+            encoding = previous.get(key)
+            if encoding is None:
+                encoding = encoded_by_id.get(student["id"])
+            if encoding is None:
+                continue
+            student_ids.append(student["id"])
+            encodings.append(encoding)
+            row_keys.append(key)
+        print(f"Publishing gallery for class {class_id}: {len(student_ids)} faces, {len(to_encode)} encoded")
+
+        gallery = Gallery.from_encodings(student_ids, encodings, self.dtype)
+        staging = tempfile.mkdtemp(prefix=f".{version}-", dir=class_dir)
+        np.save(os.path.join(staging, "ids.npy"), gallery.student_ids)
+        np.save(os.path.join(staging, "matrix.npy"), gallery.matrix)
+        np.save(os.path.join(staging, "norms.npy"), gallery.norms)
+        if gallery.scales is not None:
+            np.save(os.path.join(staging, "scales.npy"), gallery.scales)
+        with open(os.path.join(staging, "manifest.json"), "w") as manifest_file:
+            json.dump({"version": version, "quantized": gallery.scales is not None, "keys": row_keys}, manifest_file)
+        try:
+            os.rename(staging, os.path.join(class_dir, version))
+        except OSError:
+            # Already published under the same version
+            shutil.rmtree(staging, ignore_errors=True)
+
+        pointer = os.path.join(class_dir, f".current-{os.getpid()}")
+        with open(pointer, "w") as pointer_file:
+            pointer_file.write(version)
+        os.replace(pointer, os.path.join(class_dir, "current"))
+
+        # Workers that still map an old version keep their mapping after the files are unlinked
+        for entry in os.listdir(class_dir):
+            if entry not in (version, "current", ".lock") and not entry.startswith("."):
+                shutil.rmtree(os.path.join(class_dir, entry), ignore_errors=True)
+
+    def _try_map(self, class_id: int, version: str):
+        if self._current_version(class_id) != version:
+            return None
+        try:
+            return self._map(class_id, version)[0]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    # Returns the gallery for a class, mapping the published one when it is up to date.
+    # Encodings computed elsewhere (imports, benchmarks) can be given by student id.
+    # bout_id only labels the load metrics with the bout the gallery is loaded for.
+    def get(self, class_id: int, students: List[Dict], encodings: Dict = None, bout_id=None) -> Gallery:
+        bout = "" if bout_id is None else bout_id
+        students = sorted(students, key=lambda student: student["id"])
+        keys = [_student_key(student) for student in students]
+        version = self._version(keys)
+        with self._guard:
+            class_lock = self._locks.setdefault(class_id, threading.Lock())
+        with class_lock:
+            cached = self._mapped.get(class_id)
+            if cached and cached[0] == version:
+                GALLERY_LOADS.inc(bout=bout, result="hit")
+                return cached[1]
+
+            result = "mapped"
+            gallery = self._try_map(class_id, version)
+            if gallery is None:
+                class_dir = self._class_dir(class_id)
+                os.makedirs(class_dir, exist_ok=True)
+                # Only one process publishes a class at a time, the others wait and map its result
+                with open(os.path.join(class_dir, ".lock"), "w") as lock_file:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                    try:
+                        gallery = self._try_map(class_id, version)
+                        if gallery is None:
+                            result = "miss"
+                            self._publish(class_id, version, students, keys, encodings)
+                            gallery, _ = self._map(class_id, version)
+                    finally:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+            GALLERY_LOADS.inc(bout=bout, result=result)
+            self._mapped[class_id] = (version, gallery)
+            return gallery
+
+
+# One store per process, the published files are shared between processes
+gallery_store = GalleryStore()
@@ -0,0 +1,76 @@
+import os
+import numpy as np
+
+# Cheap scene-change check that runs before face detection.
+# Each frame is shrunk to a tiny grayscale grid holding the mean and the
+# contrast (standard deviation) of every cell, and compared with the grid of
+# the last frame that was fully processed. The comparison is local: a face
+# that appears or turns only changes a few cells, so the frame counts as
+# changed as soon as MOTION_MIN_CELLS cells moved by more than MOTION_THRESHOLD.
+# Sensor noise and compression average out inside a cell (about 1 level on
+# 640x480 frames), while a face-sized change moves its cells by 30 or more.
+
+THUMBNAIL_SIZE = int(os.getenv("MOTION_THUMBNAIL_SIZE", "32"))
+# Change of a cell's mean or contrast (0-255) that counts as a change of that cell
+MOTION_THRESHOLD = float(os.getenv("MOTION_THRESHOLD", "10.0"))
+# Changed cells that make the frame a scene change
+MIN_CELLS = int(os.getenv("MOTION_MIN_CELLS", "2"))
+# Force a full pass after this many skipped frames, so slow drift is never missed
+MAX_SKIPPED = int(os.getenv("MOTION_MAX_SKIPPED", "10"))
+# Same for video uploads, whose sampled frames are about a second apart
+VIDEO_MAX_SKIPPED = int(os.getenv("MOTION_VIDEO_MAX_SKIPPED", "2"))
+
+
+class MotionGate:
+    def __init__(self, threshold: float = MOTION_THRESHOLD, max_skipped: int = MAX_SKIPPED,
+                 size: int = THUMBNAIL_SIZE, min_cells: int = MIN_CELLS):
+        self.threshold = threshold
+        self.min_cells = min_cells
+        self.max_skipped = max_skipped
+        self.size = size
+        self.reference = None
+        self.consecutive_skipped = 0
+        self.frames_processed = 0
+        self.frames_skipped = 0
+
+    # Per-cell mean and standard deviation, stacked as a (2, size, size) array
+    def _thumbnail(self, frame):
+        import cv2
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        gray = gray.astype(np.float32)
+        size = (self.size, self.size)
+        mean = cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+        square = cv2.resize(gray * gray, size, interpolation=cv2.INTER_AREA)
+        return np.stack([mean, np.sqrt(np.maximum(square - mean * mean, 0))])
+
+    def _changed_cells(self, thumbnail) -> int:
+        return int(np.count_nonzero(np.abs(thumbnail - self.reference).max(axis=0) > self.threshold))
+
+    # Returns True when the frame is close enough to the last processed one to be skipped
+    def is_static(self, frame) -> bool:
+        if self.threshold <= 0:
+            self.frames_processed += 1
+            return False
+        thumbnail = self._thumbnail(frame)
+        if (
+            self.reference is not None
+            and self.consecutive_skipped < self.max_skipped
+            and self._changed_cells(thumbnail) < self.min_cells
+        ):
+            self.consecutive_skipped += 1
+            self.frames_skipped += 1
+            return True
+        self.reference = thumbnail
+        self.consecutive_skipped = 0
+        self.frames_processed += 1
+        return False
+
+    def reset(self):
+        self.reference = None
+        self.consecutive_skipped = 0
+
+    def stats(self) -> dict:
+        return {
+            "frames_processed": self.frames_processed,
+            "frames_skipped": self.frames_skipped,
+        }
@@ -1,89 +1,180 @@
 import os
-import face_recognition
-import cv2
 import numpy as np
+from contextlib import nullcontext
 from typing import List, Dict
+from face_service.motion import VIDEO_MAX_SKIPPED, MotionGate
+from face_service.detectors import FaceDetector, create_detector
+from face_service.gallery import Gallery
+from face_service.encoding_cache import EncodingCache, encoding_cache, face_hash
+from monitoring.metrics import FACES, FRAMES, FRAMES_SKIPPED, MATCHES, StageProfile
+
+# OpenCV and face_recognition (which loads the dlib models) are imported where they
+# are used, so the API starts without them; face_service/warmup.py loads them up front.
+
+# This represents the first two steps of facial recognition
+# As explained in the README.md, they are Detection and Encoding
+def encode_student_images(students: List[Dict]):
+    import face_recognition
+    student_ids = []
+    known_encodings = []
+    for student in students:
+        try:
+            # For each student, we load their image that is saved in consistent storage
+            image_path = student.get("image_path")
+            if not image_path or not os.path.exists(image_path):
+                print(f"⚠️ Image not found for student ID {student.get('id')}: {image_path}")
+                continue
+            # Recognize face boundaries, then encode them
+            image = face_recognition.load_image_file(image_path)
+            encodings = face_recognition.face_encodings(image)
+
+            if encodings:
+                student_ids.append(student["id"])
+                known_encodings.append(encodings[0])
+            else:
+                print(f"⚠️ No face found in {student['image_path']}")
+        except Exception as e:
+            print(f"Error processing image for student ID {student.get('id')}: {e}")
+    # Returns the ids and encodings of the students whose face could be encoded
+    return student_ids, known_encodings
+
+# Decodes a JPEG (or any image OpenCV reads) into a BGR frame, None when it can't
+def decode_frame(data: bytes):
+    import cv2
+    return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+
+# Raised by process_video for a file OpenCV can't open or decode a single frame of
+class UnreadableVideo(Exception):
+    pass
 
 # The heart of the system, this class is responsible for processing video stream
 # and returning the recognized students from it.
 
 class FaceProcessor:
-    def __init__(self, expected_students: List[Dict], main_folder: str = "students"):
+    def __init__(self, expected_students: List[Dict], main_folder: str = "students",
+                 detector: FaceDetector = None, gallery: Gallery = None, profile: StageProfile = None,
+                 cache: EncodingCache = None):
         self.expected_students = expected_students
         self.main_folder = main_folder
-        self.known_faces = self._load_known_faces()
+        # Detection backend, dlib HOG unless the deployment picks another one
+        self.detector = detector or create_detector()
+        # Galleries usually come from the shared gallery store, encoding here is the fallback
+        if gallery is None:
+            gallery = Gallery.from_encodings(*encode_student_images(expected_students))
+        self.gallery = gallery
+        # Encodings of face crops seen before, shared by every processor in the process
+        self.cache = cache or encoding_cache
+        # Stage timings and counters, labelled with the bout being processed
+        self.profile = profile or StageProfile()
+        # Skips detection on frames that barely changed since the last processed one
+        self.motion_gate = MotionGate()
+        self.last_result = ([], 0, [], [])
     
-    # This represents the first two steps of facial recognition
-    # As explained in the README.md, they are Detection and Encoding
-    def _load_known_faces(self):
-        known_faces = []
-        for student in self.expected_students:
-            try:
-                # For each student, we load their image that is saved in consistent storage
-                image_path = student.get("image_path")
-                print("Checking image path:", os.path.abspath(image_path))
-                print("Exists?", os.path.exists(image_path))
-                if not image_path or not os.path.exists(image_path):
-                    continue
-                # Recognize face boundaries, then encode them
-                image = face_recognition.load_image_file(image_path)
-                encodings = face_recognition.face_encodings(image)
-
-                if encodings:
-                    known_faces.append((student["id"], encodings[0]))
-                else:
-                    print(f"⚠️ No face found in {student['image_path']}")
-            except Exception as e:
-                print(f"Error processing image for student ID {student.get('id')}: {e}")
-        # Returns list of encoded faces
-        return known_faces
     # For the live video processing, this processes a single frame and tries to find faces
     def process_frame(self, frame):
-        small_frame = cv2.resize(frame, (0, 0), fx=1, fy=1)
-        rgb_frame = np.ascontiguousarray(small_frame[:, :, ::-1])
+        bout = self.profile.bout_id
+        FRAMES.inc(bout=bout)
+        # Static scene, the previous detections and identities still hold
+        with self.profile.stage("motion"):
+            static = self.motion_gate.is_static(frame)
+        if static:
+            FRAMES_SKIPPED.inc(bout=bout)
+            return self.last_result
+        self.last_result = self._process_frame(frame)
+        FACES.inc(self.last_result[1], bout=bout)
+        MATCHES.inc(len(self.last_result[0]), bout=bout)
+        return self.last_result
+
+    def _process_frame(self, frame):
+        with self.profile.stage("color"):
+            rgb_frame = np.ascontiguousarray(frame[:, :, ::-1])
         
         # Find the boundaries of the faces in the frame
-        face_locations = face_recognition.face_locations(rgb_frame)    
+        with self.profile.stage("detect"):
+            face_locations = self.detector.detect(rgb_frame)
         if not face_locations:
             return [], 0, [], []
         total_faces = len(face_locations)
         # Calculate the encodings of the detected faces
-        face_encodings = face_recognition.face_encodings(rgb_frame, face_locations)
+        face_encodings = self._encode(rgb_frame, face_locations)
         
         recognized_ids = []
         recognition_status = []
-        for encoding in face_encodings:
-            # Compare the detected face encodings with the known faces
-            # This is the final step, Face Matching
-            matches = face_recognition.compare_faces([e[1] for e in self.known_faces], encoding)
-            face_distances = face_recognition.face_distance([e[1] for e in self.known_faces], encoding)
-            best_match = np.argmin(face_distances)
-            
-            if matches[best_match]:
-                recognized_ids.append(self.known_faces[best_match][0])
+        # Compare the detected face encodings with the known faces
+        # This is the final step, Face Matching
+        with self.profile.stage("match"):
+            matches = self.gallery.match(face_encodings)
+        for student_id, _ in matches:
+            if student_id is not None:
+                recognized_ids.append(student_id)
                 recognition_status.append(True)
             else:
                 recognition_status.append(False)
         # Returns list of recognized IDs, ammt of faces detected, array of face locations and recognition status
         return recognized_ids, total_faces, face_locations, recognition_status
 
-    # This function processes a video file and returns the recognized student IDs
-    def process_video(self, video_path: str, frame_interval: int = 30):
-        recognized_ids = set()
+    # Encodes the detected faces, reusing cached encodings of crops that look the same
+    def _encode(self, rgb_frame, face_locations):
+        import face_recognition
+        if not self.cache.enabled:
+            with self.profile.stage("encode"):
+                return face_recognition.face_encodings(rgb_frame, face_locations)
+        with self.profile.stage("face_hash"):
+            keys = [face_hash(rgb_frame, location) for location in face_locations]
+            encodings = [self.cache.get(key, self.profile.bout_id) for key in keys]
+        missing = [index for index, encoding in enumerate(encodings) if encoding is None]
+        if missing:
+            with self.profile.stage("encode"):
+                computed = face_recognition.face_encodings(rgb_frame, [face_locations[i] for i in missing])
+            for index, encoding in zip(missing, computed):
+                encodings[index] = encoding
+                self.cache.put(keys[index], encoding, self.profile.bout_id)
+        return encodings
+
+    # This function processes a video file and returns the recognized student IDs.
+    # A checkpointed job passes the frame to resume from and the students found so far;
+    # checkpoint(frame_index, recognized_ids) is then called every checkpoint_every frames.
+    # frame_slot, when given, returns a context manager held while a sampled frame is processed.
+    def process_video(self, video_path: str, frame_interval: int = 30, start_frame: int = 0,
+                      found_ids=(), checkpoint=None, checkpoint_every: int = 300, frame_slot=None):
+        import cv2
+        recognized_ids = set(found_ids)
+        # Sampled frames are far apart, so only a few in a row may reuse earlier detections
+        self.motion_gate = MotionGate(max_skipped=VIDEO_MAX_SKIPPED)
         cap = cv2.VideoCapture(video_path)
+        if not cap.isOpened():
+            raise UnreadableVideo(f"Could not open video {os.path.basename(video_path)}")
         frame_count = 0
+        if start_frame > 0:
+            # Seek when the backend can, otherwise the frames before it are only grabbed
+            cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+            if int(cap.get(cv2.CAP_PROP_POS_FRAMES)) == start_frame:
+                frame_count = start_frame
+            else:
+                cap.release()
+                cap = cv2.VideoCapture(video_path)
         
         while cap.isOpened():
-            ret, frame = cap.read()
+            # Process every nth frame to improve performance, the others are only grabbed
+            sampled = frame_count >= start_frame and frame_count % frame_interval == 0
+            with self.profile.stage("decode"):
+                ret = cap.grab()
+                if ret and sampled:
+                    ret, frame = cap.retrieve()
             if not ret:
                 break
                 
-            # Process every nth frame to improve performance
-            if frame_count % frame_interval == 0:
-                frame_ids, _, _, _ = self.process_frame(frame)
+            if sampled:
+                with frame_slot() if frame_slot is not None else nullcontext():
+                    frame_ids, _, _, _ = self.process_frame(frame)
                 recognized_ids.update(frame_ids)
                 
             frame_count += 1
+            if checkpoint is not None and frame_count > start_frame and frame_count % checkpoint_every == 0:
+                checkpoint(frame_count, recognized_ids)
         
         cap.release()
-        return list(recognized_ids)
\ No newline at end of file
+        # A resumed job that seeked to the end has nothing left to read, otherwise no frames means no video
+        if frame_count == 0:
+            raise UnreadableVideo(f"No frames could be decoded from {os.path.basename(video_path)}")
+        return list(recognized_ids)
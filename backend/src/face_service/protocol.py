@@ -0,0 +1,191 @@
+import json
+import os
+import struct
+import time
+from typing import List, Optional
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Compact protocol for the live attendance WebSocket.
+#
+# A client opts in by sending a text message before its first frame:
+#   {"protocol": "delta", "encoding": "msgpack" | "struct"}
+# The server answers with a JSON "hello" holding the negotiated encoding and the
+# capture settings the client should use. Clients that start sending JPEG bytes
+# right away keep getting the legacy JSON responses.
+#
+# In the compact protocol each client frame is a 4 byte big-endian sequence
+# number followed by the JPEG. A frame with no JPEG after the sequence number
+# means "nothing changed", and the server answers it without decoding anything.
+#
+# Responses are either keyframes (full state) or deltas holding only what changed
+# since the previous response: new attendances, the recognized list and the face
+# boxes (only when they moved).
+
+PROTOCOL_NAME = "delta"
+PROTOCOL_VERSION = 1
+
+KEYFRAME = 0
+DELTA = 1
+
+# Capture settings advertised to the client in the hello message
+TARGET_WIDTH = int(os.getenv("STREAM_TARGET_WIDTH", "640"))
+TARGET_HEIGHT = int(os.getenv("STREAM_TARGET_HEIGHT", "480"))
+JPEG_QUALITY = int(os.getenv("STREAM_JPEG_QUALITY", "70"))
+KEYFRAME_INTERVAL = int(os.getenv("STREAM_KEYFRAME_INTERVAL", "30"))
+# Boxes that moved less than this many pixels are not resent
+BOX_TOLERANCE = int(os.getenv("STREAM_BOX_TOLERANCE", "4"))
+
+SEQ_HEADER = struct.Struct(">I")
+# type, seq, timestamp (ms), total faces, new attendances, recognized, boxes
+RESPONSE_HEADER = struct.Struct(">BIQHHHH")
+BOX = struct.Struct(">HHHHB")
+STUDENT_ID = struct.Struct(">I")
+# Marks a list that did not change since the previous response
+UNCHANGED = 0xFFFF
+
+
+def available_encodings() -> List[str]:
+    encodings = ["struct"]
+    if msgpack is not None:
+        encodings.insert(0, "msgpack")
+    return encodings
+
+
+# Parses the optional text handshake, returns None when it is not a compact protocol request
+def parse_handshake(text: str) -> Optional[dict]:
+    try:
+        request = json.loads(text)
+    except ValueError:
+        return None
+    if not isinstance(request, dict) or request.get("protocol") != PROTOCOL_NAME:
+        return None
+    encoding = request.get("encoding")
+    if encoding not in available_encodings():
+        encoding = available_encodings()[0]
+    return {
+        "type": "hello",
+        "protocol": PROTOCOL_NAME,
+        "version": PROTOCOL_VERSION,
+        "encoding": encoding,
+        "target_width": TARGET_WIDTH,
+        "target_height": TARGET_HEIGHT,
+        "jpeg_quality": JPEG_QUALITY,
+        "keyframe_interval": KEYFRAME_INTERVAL,
+    }
+
+
+# Splits a compact protocol frame into its sequence number and JPEG payload
+def parse_frame(data: bytes):
+    if len(data) < SEQ_HEADER.size:
+        raise ValueError("Frame is shorter than its sequence header")
+    (seq,) = SEQ_HEADER.unpack_from(data)
+    return seq, data[SEQ_HEADER.size:]
+
+
+def _boxes_moved(previous, current) -> bool:
+    if previous is None or len(previous) != len(current):
+        return True
+    for old, new in zip(previous, current):
+        if old[4] != new[4]:
+            return True
+        if any(abs(a - b) > BOX_TOLERANCE for a, b in zip(old[:4], new[:4])):
+            return True
+    return False
+
+
+# Keeps the state last sent to a client and encodes each result as a keyframe or delta
+class DeltaEncoder:
+    def __init__(self, encoding: str = "msgpack", keyframe_interval: int = KEYFRAME_INTERVAL):
+        if encoding not in available_encodings():
+            raise ValueError(f"Unsupported encoding: {encoding}")
+        self.encoding = encoding
+        self.keyframe_interval = max(1, keyframe_interval)
+        self.frames_since_keyframe = None
+        self.last_recognized = None
+        self.last_boxes = None
+
+    def encode(self, seq: int, recognized_ids, total_faces: int, face_locations,
+               recognition_status, new_attendance_ids) -> bytes:
+        recognized = sorted(set(recognized_ids))
+        boxes = [
+            (top, right, bottom, left, int(bool(status)))
+            for (top, right, bottom, left), status in zip(face_locations, recognition_status)
+        ]
+        keyframe = (
+            self.frames_since_keyframe is None
+            or self.frames_since_keyframe + 1 >= self.keyframe_interval
+        )
+        if keyframe:
+            self.frames_since_keyframe = 0
+            send_recognized, send_boxes = recognized, boxes
+        else:
+            self.frames_since_keyframe += 1
+            send_recognized = recognized if recognized != self.last_recognized else None
+            send_boxes = boxes if _boxes_moved(self.last_boxes, boxes) else None
+        self.last_recognized = recognized
+        if send_boxes is not None:
+            self.last_boxes = boxes
+
+        message = {
+            "type": KEYFRAME if keyframe else DELTA,
+            "seq": seq,
+            "timestamp": int(time.time() * 1000),
+            "total_faces": total_faces,
+            "new_attendances": list(new_attendance_ids),
+            "recognized": send_recognized,
+            "boxes": send_boxes,
+        }
+        if self.encoding == "msgpack":
+            return self._pack_msgpack(message)
+        return self._pack_struct(message)
+
+    # Answer for a frame the client marked as unchanged: an empty delta
+    def encode_unchanged(self, seq: int, total_faces: int) -> bytes:
+        return self.encode(
+            seq,
+            self.last_recognized or [],
+            total_faces,
+            [box[:4] for box in self.last_boxes or []],
+            [box[4] for box in self.last_boxes or []],
+            [],
+        )
+
+    def _pack_msgpack(self, message: dict) -> bytes:
+        # Short keys, and unchanged lists are left out entirely
+        packed = {
+            "t": message["type"],
+            "s": message["seq"],
+            "ts": message["timestamp"],
+            "n": message["total_faces"],
+        }
+        if message["new_attendances"]:
+            packed["a"] = message["new_attendances"]
+        if message["recognized"] is not None:
+            packed["r"] = message["recognized"]
+        if message["boxes"] is not None:
+            packed["b"] = [list(box) for box in message["boxes"]]
+        return msgpack.packb(packed, use_bin_type=True)
+
+    def _pack_struct(self, message: dict) -> bytes:
+        recognized = message["recognized"]
+        boxes = message["boxes"]
+        parts = [RESPONSE_HEADER.pack(
+            message["type"],
+            message["seq"] & 0xFFFFFFFF,
+            message["timestamp"],
+            min(message["total_faces"], UNCHANGED - 1),
+            len(message["new_attendances"]),
+            UNCHANGED if recognized is None else len(recognized),
+            UNCHANGED if boxes is None else len(boxes),
+        )]
+        parts.extend(STUDENT_ID.pack(student_id) for student_id in message["new_attendances"])
+        parts.extend(STUDENT_ID.pack(student_id) for student_id in recognized or [])
+        parts.extend(
+            BOX.pack(*(max(0, min(int(v), 0xFFFF)) for v in box[:4]), box[4])
+            for box in boxes or []
+        )
+        return b"".join(parts)
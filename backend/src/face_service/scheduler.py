@@ -0,0 +1,177 @@
+import asyncio
+import os
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from monitoring.metrics import ADMISSION_REJECTED
+
+# Admission control and scheduling in front of the face processors.
+# Recognition work is handed out one frame at a time as slots. At most
+# SCHEDULER_WORKERS slots run at once per process, each priority class has
+# its own limit, and waiting frames are served by priority (live streams
+# before batch uploads) and round-robin between bouts inside a class, so one
+# busy bout or a long upload cannot starve the others.
+#
+# Two limits turn work away instead of queueing it forever: the number of
+# open sessions per class (WebSocket close 1013 / HTTP 429) and the number of
+# frames waiting per class (live frames over it are answered from the
+# previous result). dlib holds the GIL, so its stages run one at a time per
+# process anyway; the pool mostly keeps the event loop free and lets the
+# OpenCV stages overlap. Scale out with more worker processes.
+#
+# The scheduler state is only touched from the event loop; worker threads go
+# through blocking_slot().
+
+WORKERS = int(os.getenv("SCHEDULER_WORKERS", str(min(4, os.cpu_count() or 1))))
+LIVE_SESSIONS = int(os.getenv("SCHEDULER_LIVE_SESSIONS", "64"))
+LIVE_QUEUE = int(os.getenv("SCHEDULER_LIVE_QUEUE", str(4 * WORKERS)))
+BATCH_LIMIT = int(os.getenv("SCHEDULER_BATCH_LIMIT", str(max(1, WORKERS // 2))))
+BATCH_JOBS = int(os.getenv("SCHEDULER_BATCH_JOBS", "4"))
+# Sent as Retry-After with a 429
+RETRY_AFTER = int(os.getenv("SCHEDULER_RETRY_AFTER", "10"))
+
+LIVE = "live"
+BATCH = "batch"
+
+
+class Overloaded(Exception):
+    pass
+
+
+class PriorityClass:
+    def __init__(self, name: str, rank: int, limit: int, max_queued: int, max_sessions: int):
+        self.name = name
+        # Lower ranks are served first
+        self.rank = rank
+        self.limit = limit
+        self.max_queued = max_queued
+        self.max_sessions = max_sessions
+        self.running = 0
+        self.sessions = 0
+        # bout id -> waiting futures, the first bout is served next
+        self.waiting = OrderedDict()
+
+    @property
+    def queued(self) -> int:
+        return sum(len(waiters) for waiters in self.waiting.values())
+
+
+def default_classes(workers: int = WORKERS):
+    return [
+        PriorityClass(LIVE, 0, workers, LIVE_QUEUE, LIVE_SESSIONS),
+        PriorityClass(BATCH, 1, min(BATCH_LIMIT, workers), BATCH_JOBS, BATCH_JOBS),
+    ]
+
+
+class Scheduler:
+    def __init__(self, workers: int = WORKERS, classes=None):
+        self.workers = workers
+        self.classes = {cls.name: cls for cls in (classes or default_classes(workers))}
+        self._by_rank = sorted(self.classes.values(), key=lambda cls: cls.rank)
+        self.running = 0
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="face-worker")
+
+    # Counts an open stream or upload job, raises Overloaded when the class is full
+    def open_session(self, name: str):
+        cls = self.classes[name]
+        if cls.sessions >= cls.max_sessions:
+            ADMISSION_REJECTED.inc(priority=name, reason="sessions")
+            raise Overloaded(f"Too many {name} sessions ({cls.max_sessions})")
+        cls.sessions += 1
+
+    def close_session(self, name: str):
+        self.classes[name].sessions -= 1
+
+    def _has_capacity(self, cls: PriorityClass) -> bool:
+        return self.running < self.workers and cls.running < cls.limit
+
+    def _start(self, cls: PriorityClass):
+        cls.running += 1
+        self.running += 1
+
+    # Hands free slots to waiters, by priority and then round-robin between bouts
+    def _dispatch(self):
+        while self.running < self.workers:
+            for cls in self._by_rank:
+                if cls.waiting and cls.running < cls.limit:
+                    break
+            else:
+                return
+            bout_id, waiters = next(iter(cls.waiting.items()))
+            future = waiters.popleft()
+            if waiters:
+                cls.waiting.move_to_end(bout_id)
+            else:
+                del cls.waiting[bout_id]
+            if future.cancelled():
+                continue
+            self._start(cls)
+            future.set_result(None)
+
+    # Waits for a slot. With reject=True a full queue raises Overloaded instead.
+    async def acquire(self, name: str, bout_id, reject: bool = True):
+        cls = self.classes[name]
+        if not cls.waiting and self._has_capacity(cls):
+            self._start(cls)
+            return
+        if reject and cls.queued >= cls.max_queued:
+            ADMISSION_REJECTED.inc(priority=name, reason="queue")
+            raise Overloaded(f"Too many queued {name} frames ({cls.max_queued})")
+        future = asyncio.get_running_loop().create_future()
+        cls.waiting.setdefault(bout_id, deque()).append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was granted just before the waiter went away
+                self.release(name)
+            else:
+                waiters = cls.waiting.get(bout_id)
+                if waiters is not None and future in waiters:
+                    waiters.remove(future)
+                    if not waiters:
+                        del cls.waiting[bout_id]
+            raise
+
+    def release(self, name: str):
+        self.classes[name].running -= 1
+        self.running -= 1
+        self._dispatch()
+
+    # Runs fn(*args) on the worker pool once a slot is free, the wait is timed as the "queue" stage
+    async def run(self, name: str, bout_id, fn, *args, profile=None):
+        with profile.stage("queue") if profile is not None else nullcontext():
+            await self.acquire(name, bout_id)
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+        finally:
+            self.release(name)
+
+    # Slot for code already running in a worker thread (e.g. a video job), waits without rejecting
+    @contextmanager
+    def blocking_slot(self, name: str, bout_id, loop):
+        asyncio.run_coroutine_threadsafe(self.acquire(name, bout_id, reject=False), loop).result()
+        try:
+            yield
+        finally:
+            loop.call_soon_threadsafe(self.release, name)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "running": self.running,
+            "classes": {
+                cls.name: {
+                    "running": cls.running,
+                    "limit": cls.limit,
+                    "queued": cls.queued,
+                    "sessions": cls.sessions,
+                    "bouts_waiting": len(cls.waiting),
+                }
+                for cls in self._by_rank
+            },
+        }
+
+
+# One scheduler per process, shared by the live feed and video uploads
+scheduler = Scheduler()
@@ -0,0 +1,290 @@
+import asyncio
+import fcntl
+import hashlib
+import json
+import os
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from tempfile import NamedTemporaryFile
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from database.database import SessionLocal
+from models.attendance import Attendance
+from models.bout import Bout
+from models.enrollment import Enrollment
+from models.student import Student
+from models.video_job import VideoJob
+from face_service.gallery_store import gallery_store
+from face_service.processor import FaceProcessor, UnreadableVideo
+from face_service.scheduler import BATCH, Overloaded, scheduler
+from monitoring.metrics import StageProfile
+
+# Uploaded videos, stored by content hash and processed as resumable jobs.
+# An upload is streamed to UPLOAD_DIR/<sha256><ext> while it is hashed, so the
+# same file sent twice is stored once. Each (bout, content hash) pair is one
+# video_job row: a repeat upload of a finished job is answered from its stored
+# results, and a job that died halfway resumes from its last checkpoint, either
+# when the file is uploaded again or when the background resumer finds it.
+#
+# Uploads of the same bytes to different bouts share one file. It is moved
+# into place and its job claimed under a lock on UPLOAD_DIR, and it is only
+# deleted under the same lock once no unfinished job refers to it, so a
+# finishing job never removes the file of one that is about to start.
+#
+# A job is owned by whoever last bumped updated_at. While a job runs, a
+# heartbeat thread bumps it every quarter of VIDEO_JOB_STALE_SECONDS, however
+# long its frames wait for a scheduler slot, so a job that has not been touched
+# for that long belonged to a worker that is gone and can be claimed.
+
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
+CHECKPOINT_FRAMES = int(os.getenv("VIDEO_CHECKPOINT_FRAMES", "300"))
+STALE_SECONDS = float(os.getenv("VIDEO_JOB_STALE_SECONDS", "120"))
+HEARTBEAT_SECONDS = STALE_SECONDS / 4
+UPLOAD_CHUNK = 1024 * 1024
+
+
+# Serialises moving uploads into place and deleting them, across worker processes
+@contextmanager
+def _upload_lock(directory: str):
+    with open(os.path.join(directory, ".lock"), "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+# Streams an upload to a temporary file while hashing it, returns (content hash, temporary path)
+async def store_upload(upload, directory: str = UPLOAD_DIR):
+    os.makedirs(directory, exist_ok=True)
+    suffix = os.path.splitext(upload.filename or "")[1].lower() or ".mp4"
+    digest = hashlib.sha256()
+    with NamedTemporaryFile(dir=directory, prefix=".", suffix=suffix + ".part", delete=False) as part:
+        try:
+            while True:
+                chunk = await upload.read(UPLOAD_CHUNK)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                part.write(chunk)
+        except BaseException:
+            os.unlink(part.name)
+            raise
+    return digest.hexdigest(), part.name
+
+
+# Moves a stored upload to UPLOAD_DIR/<hash><ext> and claims its job in one step,
+# returns (job, state, stored path) like claim_job
+def claim_upload(db: Session, bout_id: int, content_hash: str, part_path: str):
+    directory = os.path.dirname(part_path)
+    suffix = os.path.splitext(part_path[:-len(".part")])[1]
+    path = os.path.join(directory, content_hash + suffix)
+    with _upload_lock(directory):
+        # Same hash means same bytes, so replacing an existing copy changes nothing
+        os.replace(part_path, path)
+        job, state = claim_job(db, bout_id, content_hash, path)
+    return job, state, path
+
+
+# Returns (job, state): "done" for a finished job, "claimed" when the caller now
+# owns the job and must run it, "busy" when another worker is running it
+def claim_job(db: Session, bout_id: int, content_hash: str, file_path: str):
+    job = db.query(VideoJob).filter(
+        VideoJob.bout_id == bout_id,
+        VideoJob.content_hash == content_hash
+    ).first()
+    if job is None:
+        job = VideoJob(bout_id=bout_id, content_hash=content_hash, file_path=file_path,
+                       status="processing", updated_at=datetime.now())
+        db.add(job)
+        try:
+            db.commit()
+            return job, "claimed"
+        except IntegrityError:
+            # Another worker inserted the same job first
+            db.rollback()
+            job = db.query(VideoJob).filter(
+                VideoJob.bout_id == bout_id,
+                VideoJob.content_hash == content_hash
+            ).first()
+    if job.status == "done":
+        return job, "done"
+    stale = datetime.now() - timedelta(seconds=STALE_SECONDS)
+    claimed = db.query(VideoJob).filter(
+        VideoJob.id == job.id,
+        VideoJob.status != "done",
+        or_(VideoJob.status == "failed", VideoJob.updated_at < stale)
+    ).update(
+        {"status": "processing", "file_path": file_path, "updated_at": datetime.now()},
+        synchronize_session=False
+    )
+    db.commit()
+    db.refresh(job)
+    return job, "claimed" if claimed else "busy"
+
+
+def build_processor(db: Session, bout: Bout, profile: StageProfile = None) -> FaceProcessor:
+    students = db.query(Student).join(Enrollment).filter(
+        Enrollment.class_id == bout.class_id
+    ).all()
+    expected_students = [
+        {"id": s.id, "name": s.name, "image_path": s.image_path}
+        for s in students
+    ]
+    return FaceProcessor(
+        expected_students,
+        gallery=gallery_store.get(bout.class_id, expected_students, bout_id=bout.id),
+        profile=profile or StageProfile(bout.id),
+    )
+
+
+# Keeps a running job from looking stale until stop is set. Uses its own session,
+# since the job's session belongs to the thread running the job.
+def _heartbeat(job_id: int, stop: threading.Event):
+    while not stop.wait(HEARTBEAT_SECONDS):
+        db = SessionLocal()
+        try:
+            db.query(VideoJob).filter(
+                VideoJob.id == job_id,
+                VideoJob.status == "processing"
+            ).update({"updated_at": datetime.now()}, synchronize_session=False)
+            db.commit()
+        except Exception as e:
+            print(f"Video job {job_id} heartbeat failed: {e}")
+        finally:
+            db.close()
+
+
+# Runs a claimed job to the end, checkpointing as it goes, and records the attendance.
+# Returns the ids of the students found in the whole video. Blocks, so call it from a
+# worker thread; loop is the event loop whose scheduler hands out the frame slots.
+def run_job(db: Session, job: VideoJob, processor: FaceProcessor, loop=None):
+    bout_id = job.bout_id
+    frame_slot = None
+    if loop is not None:
+        frame_slot = lambda: scheduler.blocking_slot(BATCH, bout_id, loop)
+
+    def checkpoint(frame_index, recognized_ids):
+        job.last_frame = frame_index
+        job.found_ids = json.dumps(sorted(recognized_ids))
+        job.updated_at = datetime.now()
+        db.commit()
+
+    stop_heartbeat = threading.Event()
+    threading.Thread(
+        target=_heartbeat, args=(job.id, stop_heartbeat), name=f"video-job-{job.id}", daemon=True
+    ).start()
+    try:
+        found_ids = set(processor.process_video(
+            job.file_path,
+            start_frame=job.last_frame,
+            found_ids=json.loads(job.found_ids),
+            checkpoint=checkpoint,
+            checkpoint_every=CHECKPOINT_FRAMES,
+            frame_slot=frame_slot,
+        ))
+    except Exception as e:
+        # Keep the last checkpoint, a retry picks up from there
+        db.rollback()
+        job.status = "failed"
+        job.updated_at = datetime.now()
+        db.commit()
+        # Nothing to resume in a file that can't be decoded
+        if isinstance(e, UnreadableVideo) and os.path.exists(job.file_path):
+            os.unlink(job.file_path)
+        raise
+    finally:
+        stop_heartbeat.set()
+    timestamp = datetime.now()
+    with processor.profile.stage("db_write"):
+        present = {
+            row[0] for row in db.query(Attendance.student_id).filter(Attendance.bout_id == job.bout_id)
+        }
+        for student_id in found_ids - present:
+            db.add(Attendance(
+                student_id=student_id,
+                bout_id=job.bout_id,
+                register_time=timestamp,
+                presence=True
+            ))
+        job.status = "done"
+        job.found_ids = json.dumps(sorted(found_ids))
+        job.updated_at = timestamp
+        db.commit()
+    discard_upload(db, job.content_hash, job.file_path)
+    return sorted(found_ids)
+
+
+# The stored file is only needed while some job on it is unfinished
+def discard_upload(db: Session, content_hash: str, file_path: str):
+    if not file_path or not os.path.exists(file_path):
+        return
+    with _upload_lock(os.path.dirname(file_path)):
+        pending = db.query(VideoJob).filter(
+            VideoJob.content_hash == content_hash,
+            VideoJob.status != "done"
+        ).count()
+        if not pending and os.path.exists(file_path):
+            os.unlink(file_path)
+
+
+# Ids of processing jobs of open bouts that nobody has touched for a stale period
+def stale_job_ids():
+    db = SessionLocal()
+    try:
+        stale = datetime.now() - timedelta(seconds=STALE_SECONDS)
+        return [row[0] for row in db.query(VideoJob.id).join(Bout, Bout.id == VideoJob.bout_id).filter(
+            VideoJob.status == "processing",
+            VideoJob.updated_at < stale,
+            Bout.end_time.is_(None)
+        )]
+    finally:
+        db.close()
+
+
+# Claims a job whose worker went away and finishes it, returns whether it ran to the end
+def resume_job(job_id: int, loop=None) -> bool:
+    db = SessionLocal()
+    try:
+        job = db.query(VideoJob).filter(VideoJob.id == job_id).first()
+        if job is None or job.status != "processing":
+            return False
+        if not job.file_path or not os.path.exists(job.file_path):
+            job.status = "failed"
+            db.commit()
+            return False
+        job, state = claim_job(db, job.bout_id, job.content_hash, job.file_path)
+        if state != "claimed":
+            return False
+        bout = db.query(Bout).filter(Bout.id == job.bout_id).first()
+        print(f"Resuming video job {job.id} of bout {job.bout_id} from frame {job.last_frame}")
+        try:
+            run_job(db, job, build_processor(db, bout), loop)
+            return True
+        except Exception as e:
+            print(f"Video job {job.id} failed: {e}")
+            return False
+    finally:
+        db.close()
+
+
+# Background task started with the app, checks for orphaned jobs once per stale period.
+# Resumed jobs count as batch sessions like uploads, so they wait while uploads fill them.
+async def resume_video_jobs(interval: float = STALE_SECONDS):
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            for job_id in await loop.run_in_executor(None, stale_job_ids):
+                try:
+                    scheduler.open_session(BATCH)
+                except Overloaded:
+                    break
+                try:
+                    await loop.run_in_executor(None, resume_job, job_id, loop)
+                finally:
+                    scheduler.close_session(BATCH)
+        except Exception as e:
+            print(f"Video job resume failed: {e}")
+        await asyncio.sleep(interval)
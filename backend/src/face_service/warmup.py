@@ -0,0 +1,126 @@
+import os
+import threading
+import time
+import numpy as np
+from contextlib import contextmanager
+from database.database import SessionLocal
+from face_service.detectors import create_detector
+from face_service.gallery_store import gallery_store
+
+# Start-up warm-up for the face service.
+# Importing face_recognition loads the dlib models, and the first inference
+# allocates its buffers, so doing both before traffic arrives keeps the first
+# WebSocket frame from paying for them. Galleries of bouts that are still open
+# are loaded too, since their cameras are the first to reconnect after a restart.
+# The API answers liveness checks right away; readiness waits for this to finish.
+#
+# Loading the models is retried with a growing delay (WARMUP_RETRY_DELAY
+# seconds, doubled up to WARMUP_RETRY_MAX_DELAY) until it works, so a transient
+# failure does not keep /readyz at 503 until the process restarts. Preloading
+# galleries is only an optimisation: when it fails the error is reported and
+# the service becomes ready anyway, the galleries load on first use.
+
+WARMUP_ENABLED = os.getenv("WARMUP", "1") == "1"
+RETRY_DELAY = float(os.getenv("WARMUP_RETRY_DELAY", "1"))
+RETRY_MAX_DELAY = float(os.getenv("WARMUP_RETRY_MAX_DELAY", "60"))
+
+
+class WarmupState:
+    def __init__(self):
+        self.status = "pending"
+        self.error = None
+        self.attempts = 0
+        self.galleries = 0
+        self.gallery_error = None
+        self.timings = {}
+        # Set at shutdown, ends the retry loop
+        self.stopping = threading.Event()
+
+    @property
+    def ready(self) -> bool:
+        return self.status in ("ready", "disabled")
+
+    @contextmanager
+    def step(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = round(time.perf_counter() - started, 3)
+
+    def as_dict(self) -> dict:
+        return {
+            "status": self.status,
+            "error": self.error,
+            "attempts": self.attempts,
+            "galleries": self.galleries,
+            "gallery_error": self.gallery_error,
+            "timings_s": self.timings,
+        }
+
+
+warmup_state = WarmupState()
+
+
+def _load_open_galleries() -> int:
+    from models.bout import Bout
+    from models.enrollment import Enrollment
+    from models.student import Student
+
+    db = SessionLocal()
+    try:
+        class_ids = [row[0] for row in db.query(Bout.class_id).filter(Bout.end_time.is_(None)).distinct()]
+        for class_id in class_ids:
+            students = db.query(Student).join(Enrollment).filter(Enrollment.class_id == class_id).all()
+            gallery_store.get(class_id, [
+                {"id": s.id, "name": s.name, "image_path": s.image_path}
+                for s in students
+            ])
+        return len(class_ids)
+    finally:
+        db.close()
+
+
+def _load_models(state: WarmupState):
+    with state.step("import_cv2"):
+        import cv2  # noqa: F401
+    with state.step("load_models"):
+        import face_recognition
+    with state.step("inference"):
+        dummy = np.zeros((160, 160, 3), dtype=np.uint8)
+        create_detector().detect(dummy)
+        face_recognition.face_encodings(dummy, [(20, 140, 140, 20)])
+
+
+# Runs in a worker thread from the app lifespan
+def warm_up(state: WarmupState = warmup_state):
+    if not WARMUP_ENABLED:
+        state.status = "disabled"
+        return state
+    state.status = "warming"
+    started = time.perf_counter()
+    delay = RETRY_DELAY
+    while True:
+        state.attempts += 1
+        try:
+            _load_models(state)
+            state.error = None
+            break
+        except Exception as e:
+            state.status = "retrying"
+            state.error = str(e)
+            print(f"Warm-up attempt {state.attempts} failed, retrying in {delay:.0f}s: {e}")
+        if state.stopping.wait(delay):
+            state.status = "failed"
+            return state
+        delay = min(delay * 2, RETRY_MAX_DELAY)
+    try:
+        with state.step("galleries"):
+            state.galleries = _load_open_galleries()
+    except Exception as e:
+        state.gallery_error = str(e)
+        print(f"Gallery preload failed, galleries will load on first use: {e}")
+    state.status = "ready"
+    state.timings["total"] = round(time.perf_counter() - started, 3)
+    print(f"Warm-up {state.status} in {state.timings['total']}s: {state.timings}")
+    return state
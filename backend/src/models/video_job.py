@@ -0,0 +1,17 @@
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, UniqueConstraint
+from database.database import Base
+
+# One uploaded video processed for one bout, keyed by the SHA-256 of its content.
+# last_frame and found_ids are the checkpoint a restarted job resumes from.
+class VideoJob(Base):
+    __tablename__ = 'video_job'
+    __table_args__ = (UniqueConstraint('bout_id', 'content_hash'),)
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    bout_id = Column(Integer, ForeignKey('bout.id', ondelete='CASCADE'), nullable=False)
+    content_hash = Column(String(64), nullable=False)
+    file_path = Column(String(255))
+    status = Column(String(20), nullable=False, default='processing')
+    last_frame = Column(Integer, nullable=False, default=0)
+    found_ids = Column(Text, nullable=False, default='[]')
+    updated_at = Column(DateTime, nullable=False)
@@ -0,0 +1,150 @@
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+
+# In-process metrics, exposed in the Prometheus text format on /metrics.
+# Each worker process keeps its own values, so with several uvicorn workers
+# every scrape shows the numbers of the worker that answered it; label the
+# scrape target per worker (or run one worker per container) when that matters.
+
+# Bucket bounds in seconds, from a cheap colour conversion to a slow HOG pass
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names, values, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels.get(label, "")) for label in self.labels)
+        with self._lock:
+            self._values[key] += amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, key)} {value:g}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts (last one is +Inf), sum]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(label, "")) for label in self.labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                    labels = _format_labels(self.labels, key, f'le="{le}"')
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {total:.6f}")
+                lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+STAGE_SECONDS = Histogram(
+    "marrow_stage_seconds",
+    "Time spent in each recognition pipeline stage",
+    labels=("stage", "bout"),
+)
+FRAMES = Counter("marrow_frames_total", "Frames passed to the face processor", labels=("bout",))
+FRAMES_SKIPPED = Counter(
+    "marrow_frames_skipped_total",
+    "Frames answered from the previous result by the motion gate",
+    labels=("bout",),
+)
+FRAMES_DROPPED = Counter("marrow_frames_dropped_total", "Frames dropped without recognition", labels=("bout", "reason"))
+FACES = Counter("marrow_faces_total", "Faces detected", labels=("bout",))
+MATCHES = Counter("marrow_matches_total", "Faces matched to an enrolled student", labels=("bout",))
+GALLERY_LOADS = Counter(
+    "marrow_gallery_loads_total",
+    "Gallery lookups by result: hit (process cache), mapped (shared files) or miss (encoded)",
+    labels=("bout", "result"),
+)
+ENCODING_CACHE = Counter(
+    "marrow_encoding_cache_total",
+    "Face encoding cache lookups by result: hit, disk_hit or miss, and disk_error for failed SQLite calls",
+    labels=("bout", "result"),
+)
+ADMISSION_REJECTED = Counter(
+    "marrow_admission_rejected_total",
+    "Work turned away by the scheduler, by priority class and the limit that was hit",
+    labels=("priority", "reason"),
+)
+RESPONSE_CACHE = Counter(
+    "marrow_response_cache_total",
+    "Cached list endpoint lookups by result: hit, not_modified (answered with 304) or miss",
+    labels=("result",),
+)
+
+REGISTRY = [
+    STAGE_SECONDS, FRAMES, FRAMES_SKIPPED, FRAMES_DROPPED, FACES, MATCHES, GALLERY_LOADS, ENCODING_CACHE,
+    ADMISSION_REJECTED, RESPONSE_CACHE,
+]
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# Times pipeline stages for one bout. Every stage always feeds the histogram;
+# the per-stage totals are kept so a request that asked for profiling can get
+# its own breakdown back.
+class StageProfile:
+    def __init__(self, bout_id=None):
+        self.bout_id = "" if bout_id is None else bout_id
+        self.timings = defaultdict(float)
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            STAGE_SECONDS.observe(elapsed, stage=name, bout=self.bout_id)
+            self.timings[name] += elapsed
+
+    def reset(self):
+        self.timings.clear()
+
+    # Stage totals in milliseconds
+    def as_dict(self) -> dict:
+        return {name: round(seconds * 1000, 3) for name, seconds in self.timings.items()}
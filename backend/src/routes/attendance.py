@@ -3,23 +3,30 @@ from sqlalchemy.orm import Session
 from database.database import SessionLocal
 from models.bout import Bout
 from models.attendance import Attendance
-from models.student import Student
-from models.enrollment import Enrollment
 from models.class_ import Class
-from face_service.processor import FaceProcessor
+from face_service.processor import UnreadableVideo, decode_frame
+from face_service.protocol import DeltaEncoder, parse_handshake, parse_frame
+from face_service.scheduler import BATCH, LIVE, RETRY_AFTER, Overloaded, scheduler
+from face_service.video_jobs import build_processor, claim_upload, discard_upload, run_job, store_upload
+from monitoring.metrics import FRAMES_DROPPED, StageProfile
 from datetime import datetime
-import cv2
-import numpy as np
-import os
-from tempfile import NamedTemporaryFile
+import asyncio
+import json
 from database.database import get_db
 
 router = APIRouter()
 
 @router.websocket("/ws/attendance/{bout_id}")
-async def video_feed(websocket: WebSocket, bout_id: int):
+async def video_feed(websocket: WebSocket, bout_id: int, profile: bool = False):
     await websocket.accept()
+    try:
+        scheduler.open_session(LIVE)
+    except Overloaded:
+        # 1013 is "try again later"
+        await websocket.close(code=1013, reason="Too many live feeds, try again later")
+        return
     db = SessionLocal()
+    processor = None
     try:
         bout = db.query(Bout).filter(Bout.id == bout_id).first()
         if not bout:
@@ -28,49 +35,99 @@ async def video_feed(websocket: WebSocket, bout_id: int):
         if bout.end_time is not None:
             await websocket.send_json({"error": "Bout has already ended"})
             return
-        class_id = bout.class_id
-        students = db.query(Student).join(Enrollment).filter(
-            Enrollment.class_id == class_id
-        ).all()
-        processor = FaceProcessor(
-            expected_students=[
-                {"id": s.id, "name": s.name, "image_path": s.image_path} 
-                for s in students
-            ],
+        stage_profile = StageProfile(bout_id)
+        # Loading the gallery can wait on another worker publishing it or on dlib
+        # encoding new photos, so it runs off the event loop like the upload path
+        processor = await asyncio.get_running_loop().run_in_executor(
+            None, build_processor, db, bout, stage_profile
         )
+        # Set when the client negotiates the compact protocol, see face_service/protocol.py
+        encoder = None
+        total_faces = 0
         while True:
             try:
-                data = await websocket.receive_bytes()
-                frame = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    raise WebSocketDisconnect(message.get("code", 1000))
+                if message.get("text") is not None:
+                    hello = parse_handshake(message["text"])
+                    if hello is None:
+                        await websocket.send_json({"error": "Unsupported protocol request"})
+                        continue
+                    encoder = DeltaEncoder(hello["encoding"], hello["keyframe_interval"])
+                    await websocket.send_json(hello)
+                    continue
+                stage_profile.reset()
+                data = message.get("bytes") or b""
+                seq = None
+                if encoder is not None:
+                    try:
+                        seq, data = parse_frame(data)
+                    except ValueError:
+                        FRAMES_DROPPED.inc(bout=bout_id, reason="malformed")
+                        continue
+                    # Client reports an unchanged scene, answer without decoding anything
+                    if not data:
+                        await websocket.send_bytes(encoder.encode_unchanged(seq, total_faces))
+                        continue
+                with stage_profile.stage("decode"):
+                    frame = decode_frame(data)
                 if frame is None:
+                    FRAMES_DROPPED.inc(bout=bout_id, reason="undecodable")
                     continue
-                recognized_ids, total_faces, face_locations, recognition_status = processor.process_frame(frame)
-                new_attendances = []
-                for student_id in recognized_ids:
-                    existing = db.query(Attendance).filter(
-                        Attendance.student_id == student_id,
-                        Attendance.bout_id == bout_id
-                    ).first()
-                    
-                    if not existing:
-                        new_attendance = Attendance(
-                            student_id=student_id,
-                            bout_id=bout_id,
-                            register_time=datetime.now(),
-                            presence=True
-                        )
-                        new_attendances.append(new_attendance)
-                if new_attendances:
-                    db.bulk_save_objects(new_attendances)
+                try:
+                    recognized_ids, total_faces, face_locations, recognition_status = await scheduler.run(
+                        LIVE, bout_id, processor.process_frame, frame, profile=stage_profile
+                    )
+                except Overloaded:
+                    # Too many frames waiting, answer with the last detections instead
+                    FRAMES_DROPPED.inc(bout=bout_id, reason="overloaded")
+                    recognized_ids, total_faces, face_locations, recognition_status = processor.last_result
+                with stage_profile.stage("db_write"):
+                    new_attendances = []
+                    for student_id in recognized_ids:
+                        existing = db.query(Attendance).filter(
+                            Attendance.student_id == student_id,
+                            Attendance.bout_id == bout_id
+                        ).first()
+                        
+                        if not existing:
+                            new_attendance = Attendance(
+                                student_id=student_id,
+                                bout_id=bout_id,
+                                register_time=datetime.now(),
+                                presence=True
+                            )
+                            new_attendances.append(new_attendance)
+                    if new_attendances:
+                        db.bulk_save_objects(new_attendances)
+                        db.commit()
                     db.commit()
-                db.commit()
-                await websocket.send_json({
-                    "recognized": recognized_ids,
-                    "total_faces": total_faces,
-                    "face_locations": face_locations,
-                    "recognition_status": recognition_status,
-                    "timestamp": datetime.now().isoformat()
-                })
+                timings = stage_profile.as_dict() if profile else None
+                with stage_profile.stage("ws_send"):
+                    if encoder is not None:
+                        await websocket.send_bytes(encoder.encode(
+                            seq,
+                            recognized_ids,
+                            total_faces,
+                            face_locations,
+                            recognition_status,
+                            [a.student_id for a in new_attendances]
+                        ))
+                        # Binary responses have no room for it, the breakdown follows as text
+                        if timings is not None:
+                            await websocket.send_json({"type": "profile", "seq": seq, "stages_ms": timings})
+                        continue
+                    response = {
+                        "recognized": recognized_ids,
+                        "total_faces": total_faces,
+                        "face_locations": face_locations,
+                        "recognition_status": recognition_status,
+                        "timestamp": datetime.now().isoformat()
+                    }
+                    if timings is not None:
+                        response["profile"] = timings
+                    await websocket.send_json(response)
             except WebSocketDisconnect:
                 print("WebSocket disconnected")
                 break
@@ -80,12 +137,16 @@ async def video_feed(websocket: WebSocket, bout_id: int):
     except Exception as e:
         print(f"WebSocket Error: {str(e)}")
     finally:
+        scheduler.close_session(LIVE)
+        if processor is not None:
+            print(f"Bout {bout_id} live feed frame stats: {processor.motion_gate.stats()}")
         db.close()
 
 @router.post("/bouts/{bout_id}/process-video")
 async def process_video_attendance(
     bout_id: int,
     video_file: UploadFile = File(...),
+    profile: bool = False,
     db: Session = Depends(get_db)
 ):
     try:
@@ -94,36 +155,50 @@ async def process_video_attendance(
             raise HTTPException(status_code=404, detail="Bout not found")
         if bout.end_time is not None:
             raise HTTPException(status_code=400, detail="Bout has already ended")
-        students = db.query(Student).join(Enrollment).filter(
-            Enrollment.class_id == bout.class_id
-        ).all()
-        processor = FaceProcessor([
-            {"id": s.id, "name": s.name, "image_path": s.image_path} 
-            for s in students
-        ])
-        recognized_ids = set()
-        with NamedTemporaryFile(delete=False, suffix=".mp4") as temp_video:
-            content = await video_file.read()
-            temp_video.write(content)
-            temp_path = temp_video.name
-        recognized_ids = set(processor.process_video(temp_path))
-        os.unlink(temp_path)
-        timestamp = datetime.now()
-        for student_id in recognized_ids:
-            attendance = Attendance(
-                student_id=student_id,
-                bout_id=bout_id,
-                register_time=timestamp,
-                presence=True
-            )
-            db.merge(attendance)
-        db.commit()
-        return {
-            "message": "Video processed successfully",
-            "recognized_students": list(recognized_ids),
+        try:
+            scheduler.open_session(BATCH)
+        except Overloaded as e:
+            raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(RETRY_AFTER)})
+        try:
+            content_hash, part_path = await store_upload(video_file)
+            job, state, video_path = claim_upload(db, bout_id, content_hash, part_path)
+            if state == "busy":
+                raise HTTPException(status_code=409, detail="This video is already being processed for this bout")
+            response = {
+                "message": "Video processed successfully",
+                "content_hash": content_hash,
+                "cached": state == "done",
+            }
+            if state == "done":
+                # Same file already processed for this bout, answer from the stored results
+                recognized_ids = json.loads(job.found_ids)
+                discard_upload(db, content_hash, video_path)
+            else:
+                response["resumed_from_frame"] = job.last_frame
+                stage_profile = StageProfile(bout_id)
+                loop = asyncio.get_running_loop()
+
+                # Runs on a worker thread, every sampled frame waits for a batch slot
+                def process():
+                    processor = build_processor(db, bout, stage_profile)
+                    return processor, run_job(db, job, processor, loop)
+
+                processor, recognized_ids = await loop.run_in_executor(None, process)
+                response.update(processor.motion_gate.stats())
+                if profile:
+                    response["profile"] = stage_profile.as_dict()
+        finally:
+            scheduler.close_session(BATCH)
+        response.update({
+            "recognized_students": recognized_ids,
             "total_recognized": len(recognized_ids),
-            "processing_time": timestamp.isoformat()
-        }
+            "processing_time": job.updated_at.isoformat()
+        })
+        return response
+    except HTTPException:
+        raise
+    except UnreadableVideo as e:
+        raise HTTPException(status_code=422, detail=str(e))
     except Exception as e:
         db.rollback()
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
@@ -5,6 +5,7 @@ from models.bout import Bout
 from models.attendance import Attendance
 from models.student import Student
 from schemas.attendance import AttendanceRead
+from routes.response_cache import response_cache
 from datetime import datetime
 from typing import List
 
@@ -20,6 +21,7 @@ async def end_session(
         raise HTTPException(status_code=404, detail="Bout not found")
     bout.end_time = datetime.now()
     db.commit()
+    response_cache.invalidate("bouts")
     return {"message": "Bout ended successfully"}
 
 @router.get("/{bout_id}/attendance", response_model=List[AttendanceRead])
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException, Form
+from fastapi import APIRouter, Depends, HTTPException, Form, Query, Request
 from sqlalchemy.orm import Session
 from database.database import get_db
 from models.class_ import Class
@@ -8,6 +8,7 @@ from models.bout import Bout
 from schemas.class_ import ClassRead
 from schemas.bout import BoutRead
 from schemas.student import StudentRead
+from routes.response_cache import MAX_PAGE_SIZE, paginate, response_cache
 from typing import List
 
 router = APIRouter(prefix="/classes", tags=["classes"])
@@ -21,12 +22,22 @@ async def create_class(
     db.add(new_class)
     db.commit()
     db.refresh(new_class)
+    response_cache.invalidate("classes")
     return new_class
 
 @router.get("/", response_model=List[ClassRead])
-async def get_classes(db: Session = Depends(get_db)):
-    classes = db.query(Class).all()
-    return classes
+async def get_classes(
+    request: Request,
+    skip: int = Query(0, ge=0),
+    limit: int | None = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    db: Session = Depends(get_db)
+):
+    return response_cache.respond(
+        request,
+        ("classes",),
+        lambda: paginate(db.query(Class).order_by(Class.id), skip, limit),
+        ClassRead,
+    )
 
 @router.get("/{class_id}", response_model=ClassRead)
 async def get_class(
@@ -41,14 +52,21 @@ async def get_class(
 @router.get("/{class_id}/students", response_model=List[StudentRead])
 async def get_students_by_class(
     class_id: int, 
+    request: Request,
+    skip: int = Query(0, ge=0),
+    limit: int | None = Query(None, ge=1, le=MAX_PAGE_SIZE),
     db: Session = Depends(get_db)
 ):
-    students = db.query(Student).join(Enrollment).filter(
-        Enrollment.class_id == class_id
-    ).all()
-    if not students:
-        raise HTTPException(status_code=404, detail="No students found for this class")
-    return students
+    # A class without students is an empty list, not a missing resource
+    return response_cache.respond(
+        request,
+        ("students", "enrollments"),
+        lambda: paginate(
+            db.query(Student).join(Enrollment).filter(Enrollment.class_id == class_id).order_by(Student.id),
+            skip, limit
+        ),
+        StudentRead,
+    )
 
 @router.post("/{class_id}/bouts", response_model=BoutRead)
 async def create_bout(
@@ -60,6 +78,7 @@ async def create_bout(
         db.add(new_bout)
         db.commit()
         db.refresh(new_bout)
+        response_cache.invalidate("bouts")
         return new_bout
     except Exception as e:
         db.rollback()
@@ -68,7 +87,14 @@ async def create_bout(
 @router.get("/{class_id}/bouts", response_model=List[BoutRead])
 async def get_class_bouts(
     class_id: int, 
+    request: Request,
+    skip: int = Query(0, ge=0),
+    limit: int | None = Query(None, ge=1, le=MAX_PAGE_SIZE),
     db: Session = Depends(get_db)
 ):
-    bouts = db.query(Bout).filter(Bout.class_id == class_id).all()
-    return bouts
\ No newline at end of file
+    return response_cache.respond(
+        request,
+        ("bouts",),
+        lambda: paginate(db.query(Bout).filter(Bout.class_id == class_id).order_by(Bout.id), skip, limit),
+        BoutRead,
+    )
\ No newline at end of file
@@ -5,6 +5,7 @@ from models.enrollment import Enrollment
 from models.student import Student
 from models.class_ import Class
 from schemas.enrollment import EnrollmentCreate
+from routes.response_cache import response_cache
 
 router = APIRouter(prefix="/enrollments", tags=["enrollments"])
 
@@ -31,4 +32,5 @@ async def enroll_student(
     )
     db.add(new_enrollment)
     db.commit()
+    response_cache.invalidate("enrollments")
     return {"message": "Student enrolled successfully"}
\ No newline at end of file
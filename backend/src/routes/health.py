@@ -0,0 +1,17 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from face_service.scheduler import scheduler
+from face_service.warmup import warmup_state
+
+router = APIRouter(tags=["health"])
+
+# Liveness: the process is up and serving requests
+@router.get("/healthz")
+async def liveness():
+    return {"status": "alive"}
+
+# Readiness: models and hot galleries are loaded, see face_service/warmup.py
+@router.get("/readyz")
+async def readiness():
+    status_code = 200 if warmup_state.ready else 503
+    return JSONResponse({**warmup_state.as_dict(), "scheduler": scheduler.stats()}, status_code=status_code)
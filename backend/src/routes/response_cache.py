@@ -0,0 +1,111 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from monitoring.metrics import RESPONSE_CACHE
+
+# Read-through cache for the list endpoints the dashboard polls.
+# Responses are kept per process, keyed by path and query string, together with
+# the generation of every table they were built from. A write bumps the
+# generation of its tables by replacing a small file under RESPONSE_CACHE_DIR
+# (tmpfs by default), so every worker on the machine notices with one stat()
+# per table and rebuilds the response. Every response carries an ETag, and a
+# request whose If-None-Match still matches gets an empty 304.
+# Writes made outside the API are picked up after RESPONSE_CACHE_TTL seconds.
+
+CACHE_DIR = os.getenv(
+    "RESPONSE_CACHE_DIR",
+    os.path.join("/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(), "marrow-response-cache"),
+)
+CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "300"))
+CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "512"))
+MAX_PAGE_SIZE = 1000
+
+
+# Applies skip/limit to an ordered query, returns (total rows, page)
+def paginate(query, skip: int = 0, limit: int = None):
+    if not skip and limit is None:
+        items = query.all()
+        return len(items), items
+    total = query.order_by(None).count()
+    query = query.offset(skip)
+    if limit is not None:
+        query = query.limit(limit)
+    return total, query.all()
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    if not header:
+        return False
+    tags = [tag.strip() for tag in header.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+
+class ResponseCache:
+    def __init__(self, directory: str = CACHE_DIR, ttl: float = CACHE_TTL, max_entries: int = CACHE_SIZE):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # key -> (generations, etag, body, total, stored_at), oldest use first
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    # Changes whenever the table's file is replaced, None before the first write
+    def _generation(self, table: str):
+        try:
+            stat = os.stat(os.path.join(self.directory, table))
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    # Called after a write commits, drops every cached response built from these tables
+    def invalidate(self, *tables: str):
+        for table in tables:
+            path = os.path.join(self.directory, table)
+            temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}"
+            with open(temp_path, "w") as generation:
+                generation.write(str(time.time_ns()))
+            os.replace(temp_path, path)
+
+    # Serves a list endpoint. load() returns (total rows, page of ORM objects),
+    # which schema turns into the JSON body; it only runs on a miss.
+    def respond(self, request: Request, tables, load, schema) -> Response:
+        key = request.url.path + "?" + "&".join(sorted(f"{k}={v}" for k, v in request.query_params.multi_items()))
+        generations = tuple(self._generation(table) for table in tables)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry[0] != generations or now - entry[4] > self.ttl):
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+        cached = entry is not None
+        if not cached:
+            RESPONSE_CACHE.inc(result="miss")
+            total, items = load()
+            body = json.dumps(jsonable_encoder([schema.model_validate(item, from_attributes=True) for item in items])).encode()
+            entry = (generations, '"' + hashlib.sha1(body).hexdigest() + '"', body, total, now)
+            with self._lock:
+                self._entries[key] = entry
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        _, etag, body, total, _ = entry
+        headers = {"ETag": etag, "X-Total-Count": str(total), "Cache-Control": "no-cache"}
+        if _etag_matches(request.headers.get("if-none-match"), etag):
+            if cached:
+                RESPONSE_CACHE.inc(result="not_modified")
+            return Response(status_code=304, headers=headers)
+        if cached:
+            RESPONSE_CACHE.inc(result="hit")
+        return Response(body, media_type="application/json", headers=headers)
+
+
+# One cache per process, invalidations are shared through CACHE_DIR
+response_cache = ResponseCache()
@@ -1,11 +1,11 @@
-from fastapi import APIRouter, UploadFile, File, Form, Depends, HTTPException, Path
+from fastapi import APIRouter, UploadFile, File, Form, Depends, HTTPException, Path, Query, Request
 from sqlalchemy.orm import Session
 from database.database import get_db
 from models.student import Student
 from schemas.student import StudentRead
+from routes.response_cache import MAX_PAGE_SIZE, paginate, response_cache
 from typing import List
 import os
-from PIL import Image
 import io
 
 router = APIRouter(prefix="/students", tags=["students"])
@@ -16,6 +16,7 @@ async def create_student(
     image: UploadFile = File(...), 
     db: Session = Depends(get_db)
 ):
+    from PIL import Image
     os.makedirs("students", exist_ok=True)
     image_path = f"students/{name.replace(' ', '_')}.jpg"
     image_data = await image.read()
@@ -28,12 +29,22 @@ async def create_student(
     db.add(student)
     db.commit()
     db.refresh(student)
+    response_cache.invalidate("students")
     return student
 
 @router.get("/", response_model=List[StudentRead])
-async def get_students(db: Session = Depends(get_db)):
-    students = db.query(Student).all()
-    return students
+async def get_students(
+    request: Request,
+    skip: int = Query(0, ge=0),
+    limit: int | None = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    db: Session = Depends(get_db)
+):
+    return response_cache.respond(
+        request,
+        ("students",),
+        lambda: paginate(db.query(Student).order_by(Student.id), skip, limit),
+        StudentRead,
+    )
 
 @router.delete("/{student_id}", status_code=204)
 async def delete_student(
@@ -47,4 +58,6 @@ async def delete_student(
         os.remove(student.image_path)
     db.delete(student)
     db.commit()
+    # Enrollments go with the student (ON DELETE CASCADE)
+    response_cache.invalidate("students", "enrollments")
     return
\ No newline at end of file
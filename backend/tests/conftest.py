@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The services import each other as top-level packages, like uvicorn does from backend/src
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
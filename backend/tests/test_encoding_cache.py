@@ -0,0 +1,55 @@
+import sqlite3
+import numpy as np
+from face_service.encoding_cache import EncodingCache
+
+KEY = (6, 0b1011)
+NEAR = (6, 0b1010)
+
+
+def encoding(value: float):
+    return np.full(128, value)
+
+
+def disk_rows(path):
+    with sqlite3.connect(path) as connection:
+        return connection.execute("SELECT COUNT(*) FROM encodings").fetchone()[0]
+
+
+def test_near_matches_stay_within_their_scope():
+    cache = EncodingCache(max_entries=8, tolerance=2)
+    cache.put(KEY, encoding(1.0), scope=1)
+
+    assert cache.get(NEAR, scope=1)[0] == 1.0
+    assert cache.get(NEAR, scope=2) is None
+
+
+def test_disk_writes_are_batched(tmp_path):
+    path = str(tmp_path / "encodings.sqlite")
+    cache = EncodingCache(max_entries=8, path=path, disk_batch=3, disk_flush_seconds=3600)
+    cache.put((6, 1), encoding(1.0))
+    cache.put((6, 2), encoding(2.0))
+    assert disk_rows(path) == 0
+
+    cache.put((6, 3), encoding(3.0))
+    assert disk_rows(path) == 3
+
+    other_worker = EncodingCache(max_entries=8, path=path)
+    assert other_worker.get((6, 2))[0] == 2.0
+    assert other_worker.disk_hits == 1
+
+
+def test_disk_errors_fall_back_to_a_miss(tmp_path):
+    path = str(tmp_path / "encodings.sqlite")
+    cache = EncodingCache(max_entries=8, path=path, disk_batch=1)
+    # Another process holding a write lock on the file
+    blocker = sqlite3.connect(path, timeout=0)
+    blocker.execute("BEGIN EXCLUSIVE")
+    cache._disk.execute("PRAGMA busy_timeout = 0")
+
+    cache.put(KEY, encoding(1.0))
+    cache._entries.clear()
+    assert cache.get(KEY) is None
+    assert cache.disk_errors >= 1
+
+    blocker.rollback()
+    blocker.close()
@@ -0,0 +1,67 @@
+import sys
+import types
+import numpy as np
+import pytest
+from face_service.gallery_store import GalleryStore
+
+
+# Stands in for dlib: every photo encodes to a vector derived from its first byte
+@pytest.fixture
+def face_recognition(monkeypatch):
+    module = types.ModuleType("face_recognition")
+    module.calls = []
+
+    def load_image_file(path):
+        module.calls.append(path)
+        with open(path, "rb") as image:
+            return np.frombuffer(image.read(), dtype=np.uint8)
+
+    def face_encodings(image):
+        encoding = np.zeros(128)
+        encoding[int(image[0]) % 128] = 1.0
+        return [encoding]
+
+    module.load_image_file = load_image_file
+    module.face_encodings = face_encodings
+    monkeypatch.setitem(sys.modules, "face_recognition", module)
+    return module
+
+
+def write_students(directory, ids):
+    students = []
+    for student_id in ids:
+        path = directory / f"student_{student_id}.jpg"
+        path.write_bytes(bytes([student_id]))
+        students.append({"id": student_id, "name": f"Student {student_id}", "image_path": str(path)})
+    return students
+
+
+def test_get_encodes_students_without_given_encodings(tmp_path, face_recognition):
+    students = write_students(tmp_path, [3, 1, 2])
+    store = GalleryStore(str(tmp_path / "galleries"), dtype="float32")
+
+    gallery = store.get(7, students)
+
+    assert len(gallery) == 3
+    assert list(gallery.student_ids) == [1, 2, 3]
+    assert len(face_recognition.calls) == 3
+
+
+def test_get_reuses_mapped_and_published_galleries(tmp_path, face_recognition):
+    students = write_students(tmp_path, [1, 2])
+    directory = str(tmp_path / "galleries")
+
+    first = GalleryStore(directory, dtype="float32").get(7, students)
+    assert GalleryStore(directory, dtype="float32").get(7, students) is not first
+    assert len(face_recognition.calls) == 2
+
+
+def test_get_only_encodes_new_students(tmp_path, face_recognition):
+    students = write_students(tmp_path, [1, 2, 5])
+    store = GalleryStore(str(tmp_path / "galleries"), dtype="float32")
+    store.get(7, students[:2])
+
+    gallery = store.get(7, students)
+
+    assert list(gallery.student_ids) == [1, 2, 5]
+    assert face_recognition.calls[2:] == [students[2]["image_path"]]
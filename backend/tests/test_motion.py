@@ -0,0 +1,42 @@
+import cv2
+import numpy as np
+import pytest
+from face_service.motion import MotionGate
+
+
+# A smooth classroom-like frame, 640x480 BGR
+@pytest.fixture
+def frame():
+    rng = np.random.default_rng(0)
+    background = rng.integers(30, 130, (60, 80, 3)).astype(np.uint8)
+    return cv2.resize(background, (640, 480), interpolation=cv2.INTER_CUBIC)
+
+
+def with_region(frame, region):
+    changed = frame.copy()
+    changed[200:270, 300:380] = region
+    return changed
+
+
+def test_sensor_noise_is_static(frame):
+    gate = MotionGate()
+    rng = np.random.default_rng(1)
+    assert not gate.is_static(frame)
+    noisy = np.clip(frame + rng.normal(0, 3, frame.shape), 0, 255).astype(np.uint8)
+    assert gate.is_static(noisy)
+
+
+@pytest.mark.parametrize("region", [
+    255,
+    np.random.default_rng(2).integers(0, 256, (70, 80, 3), dtype=np.uint8),
+])
+def test_face_sized_local_change_is_not_skipped(frame, region):
+    gate = MotionGate()
+    assert not gate.is_static(frame)
+    assert not gate.is_static(with_region(frame, region))
+
+
+def test_skips_are_capped(frame):
+    gate = MotionGate(max_skipped=2)
+    results = [gate.is_static(frame) for _ in range(4)]
+    assert results == [False, True, True, False]